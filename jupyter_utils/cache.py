@@ -0,0 +1,96 @@
+import hashlib
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+
+def _real(value):
+    return np.nan if value is None else value
+
+
+def fingerprint(series: pd.Series) -> str:
+    """
+    A content hash of a column (its values and dtype, not its name or index), so that an unchanged column keeps the
+    same fingerprint between runs. Uses xxhash when it is installed.
+    """
+    values = pd.util.hash_pandas_object(series, index=False).values
+    try:
+        import xxhash
+        digest = xxhash.xxh64()
+    except ImportError:
+        digest = hashlib.blake2b(digest_size=8)
+
+    digest.update(str(series.dtype).encode('utf-8'))
+    digest.update(np.ascontiguousarray(values).view(np.uint8))
+    return digest.hexdigest()
+
+
+class AssociationCache:
+    """
+    An on-disk (sqlite) cache of pairwise association values, keyed by method and the fingerprints of the two columns.
+    Each value is a pair of floats (e.g. U(x,y) and U(y,x), or r and p), stored as REAL columns. Holds at most
+    max_entries values, evicting the least recently used, and counts hits and misses.
+    """
+
+    def __init__(self, path, max_entries=1000000):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS association_values "
+                           "(key TEXT PRIMARY KEY, first REAL, second REAL, last_used INTEGER)")
+        self._max_entries = max_entries
+        self._clock = self._conn.execute("SELECT COALESCE(MAX(last_used), 0) FROM association_values").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(method, x_fingerprint, y_fingerprint):
+        return "{}:{}:{}".format(method, x_fingerprint, y_fingerprint)
+
+    def get_many(self, keys):
+        """The cached values of those keys that are present, as a dict."""
+        found = {}
+        keys = list(keys)
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            rows = self._conn.execute("SELECT key, first, second FROM association_values WHERE key IN ({})"
+                                      .format(",".join("?" * len(batch))), batch).fetchall()
+            # sqlite keeps NaN as NULL
+            found.update({key: (_real(first), _real(second)) for key, first, second in rows})
+
+        self._clock += 1
+        self._conn.executemany("UPDATE association_values SET last_used = ? WHERE key = ?",
+                               [(self._clock, key) for key in found.keys()])
+        self._conn.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, values):
+        self._clock += 1
+        self._conn.executemany("INSERT OR REPLACE INTO association_values (key, first, second, last_used) "
+                               "VALUES (?, ?, ?, ?)",
+                               [(key, float(first), float(second), self._clock)
+                                for key, (first, second) in values.items()])
+        self._evict()
+        self._conn.commit()
+
+    def _evict(self):
+        excess = len(self) - self._max_entries
+        if excess > 0:
+            self._conn.execute("DELETE FROM association_values WHERE key IN "
+                               "(SELECT key FROM association_values ORDER BY last_used LIMIT ?)", (excess,))
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM association_values").fetchone()[0]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self)}
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
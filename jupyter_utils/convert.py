@@ -1,48 +1,65 @@
 from pandas.api.types import is_string_dtype, is_numeric_dtype, is_categorical_dtype
-import multiprocessing as mp
 from jupyter_utils.datatype import *
 import pandas as pd
 import numpy as np
 from functools import partial
 
 
-def _to_categorical(series):
-    if is_string_dtype(series):
-        return series.astype('category').cat.as_ordered()
-    else:
-        return series
+def _factorize_chunk(tpl):
+    name, start, values = tpl
+    codes, uniques = pd.factorize(values)
+    return name, start, codes.astype(np.int32) if len(uniques) < 2 ** 31 else codes, uniques
+
+
+def _merge_chunks(length, chunks):
+    # astype('category') on the chunks' uniques gives the sorted categories, and the global code of each local one
+    levels = pd.Categorical(np.concatenate([uniques for _, _, uniques in chunks]))
+    codes = np.empty(length, dtype=np.int64 if len(levels.categories) >= 2 ** 31 else np.int32)
+    offset = 0
+    for start, local_codes, uniques in chunks:
+        remap = np.append(levels.codes[offset:offset + len(uniques)], -1)
+        # local codes of -1 pick up the trailing -1
+        codes[start:start + len(local_codes)] = remap.take(local_codes)
+        offset += len(uniques)
 
+    return pd.Categorical.from_codes(codes, levels.categories, ordered=True)
 
-def _coerce_to_numeric(col, cutoff, logger, ignore=list()):
-    if is_numeric(col.dtype):
-        return col
 
-    if is_timestamp(col.dtype):
-        return col
+def _sample_values(col, sample_size, random):
+    values = col.values
+    if len(values) > sample_size:
+        values = values[random.randint(0, len(values), sample_size)]
 
-    if col.name in ignore:
-        return col
+    return pd.unique(values[pd.notnull(values)])
 
-    values = col.dropna().unique()
-    ratio = 0
+
+def _coerce_ratio(values, cutoff, block_size=1000):
+    """
+    The fraction of distinct values that are not numeric, stopping early (with the ratio so far) once the failures
+    alone are enough to take it over cutoff.
+    """
     pre_length = len(values)
+    if pre_length == 0:
+        return 0
 
-    if pre_length > 0:
-        new_values = pd.to_numeric(values, errors='coerce')
-        post_length = len(new_values[~np.isnan(new_values)])
-        ratio = (pre_length - post_length) / pre_length
+    failures = 0
+    for start in range(0, pre_length, block_size):
+        new_values = pd.to_numeric(values[start:start + block_size], errors='coerce')
+        failures += int(np.isnan(np.asarray(new_values, dtype=float)).sum())
+        if failures > cutoff * pre_length:
+            break
+
+    return failures / pre_length
 
-    if ratio <= cutoff:
-        logger.info("Converting column {} to numeric (ratio: {})".format(col, ratio))
-        return pd.to_numeric(col, errors='coerce')
-    else:
-        logger.debug("Not converting column {} (ratio: {})".format(col, ratio))
-        return col
+
+def _coerce_to_numeric(tpl, cutoff):
+    name, values = tpl
+    return name, _coerce_ratio(values, cutoff)
 
 
 def to_bool(df):
     new_df = df.copy()
-    for series in get_continuous(new_df).columns:
+    for series in schema(df).columns_of('float'):
         min = new_df[series].min()
         max = new_df[series].max()
         if min == 0 and max == 1:
@@ -51,14 +68,122 @@ def to_bool(df):
     return new_df
 
 
-def coerce_to_numeric(df, logger, cutoff=0.10, ignore=list()) -> pd.DataFrame:
-    new_df = df.copy()
-    with mp.Pool(mp.cpu_count()-1) as pool:
-        for series in pool.imap(partial(_coerce_to_numeric, cutoff=cutoff, logger=logger, ignore=ignore),
-                                (df[col] for col in df.columns)):
-            new_df[series.name] = series
+def coerce_to_numeric(df, logger, cutoff=0.10, ignore=list(), processes=None, sample_size=10000) -> pd.DataFrame:
+    """
+    Converts, in place, the object and categorical columns whose values are (nearly) all numeric. Whether a column
+    converts is decided from its categories, or from the distinct values in a bounded sample of an object column,
+    as the fraction that fail to parse, which must not exceed cutoff.
 
-    return new_df
+    Parameters:
+    -----------
+    df: A pandas dataframe, which is changed in place and returned.
+    processes: The number of workers to check object columns in, defaulting to one less than the number of cpus.
+        With 1 the checks run in this process.
+    sample_size: The number of rows sampled from each object column.
+    """
+    import multiprocessing as mp
+
+    info = schema(df)
+    columns = [col for col in info.columns_of('string', 'categorical', 'other') if col not in ignore]
+    categorical = [col for col in columns if info.kinds[col] == 'categorical']
+    random = np.random.RandomState(0)
+    samples = [(col, _sample_values(df[col], sample_size, random)) for col in columns if col not in categorical]
+
+    if processes is None:
+        processes = max(mp.cpu_count() - 1, 1)
+
+    decide = partial(_coerce_to_numeric, cutoff=cutoff)
+    ratios = [decide((col, df[col].cat.categories.values)) for col in categorical]
+    if processes > 1 and len(samples) > 1:
+        with mp.Pool(min(processes, len(samples))) as pool:
+            ratios.extend(pool.imap(decide, samples))
+    else:
+        ratios.extend(map(decide, samples))
+
+    for name, ratio in ratios:
+        if ratio > cutoff:
+            logger.debug("Not converting column {} (ratio: {})".format(name, ratio))
+            continue
+
+        logger.info("Converting column {} to numeric (ratio: {})".format(name, ratio))
+        col = df[name]
+        if name in categorical:
+            new_values = np.append(np.asarray(pd.to_numeric(col.cat.categories.values, errors='coerce')), np.nan)
+            # codes of -1 pick up the trailing NaN
+            df[name] = pd.Series(new_values[col.cat.codes.values], index=df.index)
+        else:
+            df[name] = pd.to_numeric(col, errors='coerce')
+
+    return df
+
+
+def _smallest_int(min, max):
+    # signed before unsigned of the same size, and None when not even (u)int64 holds the range
+    min, max = int(min), int(max)
+    dtypes = (np.int8, np.uint8, np.int16, np.uint16, np.int32, np.uint32, np.int64, np.uint64) if min >= 0 else \
+        (np.int8, np.int16, np.int32, np.int64)
+    for dtype in dtypes:
+        info = np.iinfo(dtype)
+        if info.min <= min and max <= info.max:
+            return dtype
+
+    return None
+
+
+def _optimal_dtype(col, kind, integral, max_category_ratio):
+    if kind == 'string':
+        if len(col) > 0 and len(pd.unique(col.values)) / len(col) <= max_category_ratio:
+            return 'category'
+        return None
+
+    if kind not in {'int', 'float'}:
+        return None
+
+    has_nulls = bool(col.isnull().any())
+    if not has_nulls and integral():
+        if len(col) == 0:
+            return None
+        min, max = col.min(), col.max()
+        if min >= 0 and max <= 1:
+            return bool
+        return _smallest_int(min, max)
+
+    if col.dtype == np.float64:
+        values = col.values
+        # only when every value survives the round trip through float32 unchanged
+        if ((values.astype(np.float32).astype(values.dtype) == values) | np.isnan(values)).all():
+            return np.float32
+
+    return None
+
+
+def optimize_dtypes(df, max_category_ratio=0.5, deep=True):
+    """Shrinks the dtypes of df's columns in place, one column at a time: integral columns to the smallest int that
+    holds them (or bool for 0/1), floats to float32 where no value changes, and object columns with few distinct
+    values (at most max_category_ratio of the rows) to category.
+
+    Parameters:
+    -----------
+    df: A pandas dataframe, which is changed in place.
+    deep: Measure the memory of object columns by their contents, as DataFrame.memory_usage(deep=True).
+
+    Returns:
+    --------
+    (df, report): report has the dtype and bytes of each column before and after.
+    """
+    info = schema(df)
+    records = []
+    for col in df.columns.tolist():
+        before_dtype, before_bytes = df[col].dtype, df[col].memory_usage(index=False, deep=deep)
+        dtype = _optimal_dtype(df[col], info.kinds[col], partial(info.could_be_int, col), max_category_ratio)
+        if dtype is not None:
+            df[col] = df[col].astype(dtype)
+
+        records.append({'column': col, 'before_dtype': before_dtype, 'after_dtype': df[col].dtype,
+                        'before_bytes': before_bytes, 'after_bytes': df[col].memory_usage(index=False, deep=deep)})
+
+    return df, pd.DataFrame(records, columns=['column', 'before_dtype', 'after_dtype', 'before_bytes',
+                                              'after_bytes']).set_index('column')
 
 
 def categorical_to_codes(df, max_n_cat=50):
@@ -70,19 +195,180 @@ def categorical_to_codes(df, max_n_cat=50):
     return df_copy
 
 
-def to_onehot(df):
+class CategoryEncoder:
+    """
+    The category dictionary of each categorical (or string) column of a training frame, so that scoring batches can
+    be encoded with the same codes without the training data. Values not seen in training are treated as missing
+    (unseen='na') or raise a ValueError (unseen='error').
+
+    >>> encoder = CategoryEncoder().fit(train)
+    >>> encoder.save('categories.npz')
+    >>> CategoryEncoder.load('categories.npz').transform(batch)
+    """
+
+    def __init__(self, unseen='na'):
+        if unseen not in {'na', 'error'}:
+            raise ValueError("Expecting one of na, error for unseen")
+
+        self.unseen = unseen
+        self.categories = {}
+        self.ordered = {}
+
+    def fit(self, df, columns=None):
+        if columns is None:
+            columns = schema(df).columns_of('categorical', 'string')
+
+        for col in columns:
+            if is_categorical(df[col].dtype):
+                self.categories[col] = df[col].cat.categories
+                self.ordered[col] = df[col].cat.ordered
+            else:
+                self.categories[col] = pd.Categorical(df[col].dropna().unique()).categories
+                self.ordered[col] = True
+
+        return self
+
+    def codes(self, col, values):
+        """The codes of values in col's categories, with -1 for missing (and unseen) values."""
+        values = np.asarray(values)
+        # a hash lookup, with the table built once per column and kept by the Index
+        codes = self.categories[col].get_indexer(values)
+        if self.unseen == 'error':
+            unseen = (codes < 0) & pd.notnull(values)
+            if unseen.any():
+                raise ValueError("Unseen values in column {}: {}".format(col, pd.unique(values[unseen])[:10]))
+
+        return codes
+
+    def transform(self, df):
+        """Changes the fitted columns of df to categoricals with the fitted categories, in place."""
+        for col, categories in self.categories.items():
+            if col in df.columns:
+                df[col] = pd.Series(pd.Categorical.from_codes(self.codes(col, df[col]), categories=categories,
+                                                              ordered=self.ordered[col]), index=df.index)
+
+        return df
+
+    def to_codes(self, df):
+        """Replaces the fitted columns of df with their codes + 1 (0 for missing), as categorical_to_codes, in place."""
+        for col in self.categories.keys():
+            if col in df.columns:
+                df[col] = self.codes(col, df[col]) + 1
+
+        return df
+
+    def save(self, path):
+        """Saves the categories with store.save_arrays."""
+        from jupyter_utils.store import save_arrays
+        columns = [[col, bool(self.ordered[col])] for col in self.categories]
+        save_arrays(path, {'unseen': self.unseen, 'columns': columns}, list(self.categories.items()))
+
+    @classmethod
+    def load(cls, path):
+        from jupyter_utils.store import load_arrays
+        meta, arrays = load_arrays(path)
+        encoder = cls(unseen=meta['unseen'])
+        for (col, ordered), categories in zip(meta['columns'], arrays):
+            encoder.categories[col] = pd.Index(categories)
+            encoder.ordered[col] = ordered
+
+        return encoder
+
+
+def _onehot_levels(codes, n_levels, max_levels):
+    # the position of each level among the kept ones, with the rest sharing the position after them
+    if max_levels is None or n_levels <= max_levels:
+        return np.arange(n_levels), np.ones(n_levels, dtype=bool), False
+
+    counts = np.bincount(codes[codes >= 0], minlength=n_levels)
+    kept = np.zeros(n_levels, dtype=bool)
+    kept[np.argsort(-counts, kind='mergesort')[:max_levels]] = True
+    positions = np.where(kept, np.cumsum(kept) - 1, max_levels)
+    return positions, kept, True
+
+
+def to_sparse_onehot(df, max_levels=None, dummy_na=False):
+    """One hot encodes the categorical and string columns of df straight from their codes in to a
+    scipy.sparse.csr_matrix, without building dense dummy columns, and keeps the numeric and bool columns alongside,
+    first and in their original order. Other columns (e.g. timestamps, see features.create_dateparts) can't be put in
+    the matrix and raise a ValueError.
+
+    Parameters:
+    -----------
+    df: A pandas dataframe.
+    max_levels: Keep only this many of the most frequent levels of each column, with the rest in a {col}_other
+        column.
+    dummy_na: Add a {col}_nan column for missing values, as pd.get_dummies.
+
+    Returns:
+    --------
+    (matrix, names): the csr_matrix, and the name of each of its columns.
+    """
+    import scipy.sparse
+
+    info = schema(df)
+    categorical = info.columns_of('categorical', 'string')
+    others = [col for col in df.columns if col not in categorical]
+    unsupported = [col for col in others if info.kinds[col] not in {'int', 'float', 'bool'}]
+    if len(unsupported) > 0:
+        raise ValueError("Can't put columns {} in a sparse matrix, convert them to numbers first".format(unsupported))
+
+    names = list(others)
+    blocks = [scipy.sparse.csr_matrix(np.column_stack([float_values(df[col]) for col in others]))] \
+        if len(others) > 0 else []
+
+    rows = np.arange(len(df))
+    for col in categorical:
+        if info.kinds[col] == 'categorical':
+            codes = df[col].cat.codes.values.astype(np.intp)
+            categories = df[col].cat.categories
+        else:
+            codes, categories = pd.factorize(df[col], sort=True)
+        positions, kept, has_other = _onehot_levels(codes, len(categories), max_levels)
+        width = int(kept.sum()) + has_other
+        names.extend('{}_{}'.format(col, level) for level in categories[kept])
+        if has_other:
+            names.append('{}_other'.format(col))
+
+        present = codes >= 0
+        columns = positions[codes[present]]
+        row_index = rows[present]
+        if dummy_na:
+            names.append('{}_nan'.format(col))
+            columns = np.concatenate([columns, np.full((~present).sum(), width)])
+            row_index = np.concatenate([row_index, rows[~present]])
+            width += 1
+
+        blocks.append(scipy.sparse.csr_matrix((np.ones(len(columns), dtype=np.uint8), (row_index, columns)),
+                                              shape=(len(df), width)))
+
+    if len(blocks) == 0:
+        return scipy.sparse.csr_matrix((len(df), 0)), names
+
+    return scipy.sparse.hstack(blocks, format='csr'), names
+
+
+def to_onehot(df, sparse=False, max_levels=None):
+    if sparse:
+        return to_sparse_onehot(df, max_levels=max_levels)
+
     return pd.get_dummies(df, columns=[col for col in df.columns.tolist() if is_categorical_dtype(df[col].dtype)])
 
 
-def to_categorical(df, logger):
-    new_df = df.copy()
+def to_categorical(df, logger, processes=None, chunk_size=1000000):
     """Change any columns of strings in a panda's dataframe to a column of
     categorical values. This applies the changes inplace.
 
+    Each column is factorized in chunks of rows across a pool of workers, and the
+    chunks' codes are then remapped on to the column's sorted categories.
+
     Parameters:
     -----------
     df: A pandas dataframe. Any columns of strings will be changed to
         categorical values.
+    processes: The number of workers, defaulting to one less than the number of cpus.
+        With 1 the chunks are factorized in this process.
+    chunk_size: The number of rows factorized at a time.
 
     Examples:
     ---------
@@ -96,7 +382,7 @@ def to_categorical(df, logger):
 
     note the type of col2 is string
 
-    >>> train_cats(df)
+    >>> to_categorical(df, logger)
     >>> df
 
        col1 col2
@@ -106,11 +392,34 @@ def to_categorical(df, logger):
 
     now the type of col2 is category
     """
+    import multiprocessing as mp
+
+    columns = [col for col in df.columns if is_string_dtype(df[col].dtype)]
+    if len(columns) == 0:
+        return df
+
+    if processes is None:
+        processes = max(mp.cpu_count() - 1, 1)
+
+    tasks = ((col, start, df[col].values[start:start + chunk_size])
+             for col in columns for start in range(0, max(len(df), 1), chunk_size))
+    chunks = {col: [] for col in columns}
+
+    def merge(results):
+        for name, start, codes, uniques in results:
+            chunks[name].append((start, codes, uniques))
+            if start + chunk_size >= len(df):
+                # chunks come back in order, so this is the column's last
+                df[name] = pd.Series(_merge_chunks(len(df), chunks.pop(name)), index=df.index)
+                #logger.info("Processed {}".format(name))
+
+    if processes > 1:
+        import itertools
+        with mp.Pool(processes) as pool:
+            # a few chunks per worker at a time, as imap would otherwise read every chunk in to its queue up front
+            for batch in iter(lambda: list(itertools.islice(tasks, processes * 2)), []):
+                merge(pool.imap(_factorize_chunk, batch))
+    else:
+        merge(map(_factorize_chunk, tasks))
 
-
-    with mp.Pool(mp.cpu_count()-1) as pool:
-        for series in pool.imap(_to_categorical, (df[col] for col in df.columns if is_string_dtype(df[col].dtype))):
-            #logger.info("Processed {}".format(series.name))
-            new_df[series.name] = series
-
-    return new_df
\ No newline at end of file
+    return df
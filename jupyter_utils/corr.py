@@ -5,11 +5,12 @@ import pandas as pd
 import scipy.stats as ss
 
 from collections import Counter
-import multiprocessing as mp
 
 
 from functools import partial
 from jupyter_utils import datatype
+from jupyter_utils.store import shared_pool, attached, attached_state
+from jupyter_utils.cache import AssociationCache, fingerprint
 
 ## culled from https://github.com/shakedzy/dython/blob/master/dython/nominal.py
 def conditional_entropy(x, y):
@@ -48,7 +49,15 @@ def cramers_v(x, y):
     :return: float
         in the range of [0,1]
     """
-    confusion_matrix = pd.crosstab(x,y)
+    return cramers_v_table(pd.crosstab(x,y).values)
+
+
+def cramers_v_table(confusion_matrix):
+    """
+    Calculates Cramer's V from a contingency table of joint counts (see cramers_v).
+    :param confusion_matrix: ndarray of joint counts
+    :return: float
+    """
     chi2 = ss.chi2_contingency(confusion_matrix)[0]
     n = confusion_matrix.sum().sum()
     phi2 = chi2/n
@@ -83,34 +92,697 @@ def theils_u(x, y):
     else:
         return (s_x - s_xy) / s_x
 
-def _process(tpl, method):
-    x = tpl[0]
-    y = tpl[1]
-    value = method(x, y)
+def correlation_ratio(categories, measurements):
+    """
+    Calculates the correlation ratio (eta) for categorical-continuous association: how well the mean of the
+    measurements within each category explains their overall spread.
+    Wikipedia: https://en.wikipedia.org/wiki/Correlation_ratio
+    :param categories: list / NumPy ndarray / Pandas Series
+        A sequence of categorical measurements
+    :param measurements: list / NumPy ndarray / Pandas Series
+        A sequence of continuous measurements
+    :return: float
+        in the range of [0,1]
+    """
+    return correlation_ratio_codes(*factorize(pd.Series(categories)), np.asarray(measurements, dtype=np.float64))
+
+
+def correlation_ratio_codes(codes, n_levels, measurements):
+    """
+    Calculates the correlation ratio from factorized categories, with grouped sums from bincount. Rows with a missing
+    measurement are left out.
+    """
+    present = ~np.isnan(measurements)
+    codes, measurements = _widen(codes, n_levels)[present], measurements[present]
+    counts = np.bincount(codes, minlength=n_levels)
+    sums = np.bincount(codes, weights=measurements, minlength=n_levels)
+    mean = measurements.mean()
+    total = np.sum((measurements - mean) ** 2)
+    if total == 0:
+        return 0.
+
+    occupied = counts > 0
+    between = np.sum(counts[occupied] * (sums[occupied] / counts[occupied] - mean) ** 2)
+    return np.sqrt(between / total)
+
+
+def _process_shared(pair, method):
+    x, y = pair
+    store = attached()
+    value = method(store.values(x), store.values(y))
 
     return {
-        'x': x.name,
-        'y': y.name,
+        'x': x,
+        'y': y,
         'value': value
     }
 
-def categorical(df):
+
+def factorize(series):
+    """
+    Encodes a column as dense integer codes, with missing values given a level of their own (as Counter would). A
+    categorical column keeps its own codes at their native width, with -1 for missing; see _widen.
+    :param series: Pandas Series
+    :return: (codes, n_levels)
+    """
+    if datatype.is_categorical(series.dtype):
+        return _missing_as_level(series.cat.codes.values, len(series.cat.categories))
+
+    codes, uniques = pd.factorize(series)
+    return _missing_as_level(codes, len(uniques))
+
+
+def _missing_as_level(codes, n_levels):
+    # the codes are left as they are, the missing level (-1) being mapped to the last one by _widen
+    if len(codes) > 0 and codes.min() < 0:
+        n_levels += 1
+
+    return codes, n_levels
+
+
+def _widen(codes, n_levels):
+    """The codes of a factorized column as intp, with missing (-1) as the last of n_levels."""
+    codes = codes.astype(np.intp)
+    codes[codes < 0] = n_levels - 1
+    return codes
+
+
+def contingency(x_codes, x_levels, y_codes, y_levels):
+    """
+    Joint counts of two factorized columns, from a single bincount over the combined codes. The codes are only
+    widened to intp for the pair at hand.
+    :return: ndarray of shape (x_levels, y_levels)
+    """
+    return np.bincount(_widen(x_codes, x_levels) * y_levels + _widen(y_codes, y_levels),
+                       minlength=x_levels * y_levels).reshape(x_levels, y_levels)
+
+
+def _entropy(counts):
+    counts = counts[counts > 0]
+    p = counts / counts.sum()
+    return -np.sum(p * np.log(p))
+
+
+def theils_u_table(table):
+    """
+    Calculates both directions of Theil's U from one contingency table.
+    :param table: ndarray of joint counts, x along the rows and y along the columns
+    :return: (U(x,y), U(y,x))
+    """
+    s_x = _entropy(table.sum(axis=1))
+    s_y = _entropy(table.sum(axis=0))
+    s_joint = _entropy(table.ravel())
+    # S(x|y) = S(x,y) - S(y)
+    u_xy = 1 if s_x == 0 else (s_x - (s_joint - s_y)) / s_x
+    u_yx = 1 if s_y == 0 else (s_y - (s_joint - s_x)) / s_y
+    return u_xy, u_yx
+
+
+def conditional_entropy_table(table):
+    """
+    Calculates the conditional entropy S(x|y) from a contingency table, x along the rows and y along the columns.
+    """
+    return _entropy(table.ravel()) - _entropy(table.sum(axis=0))
+
+
+class ContingencyAccumulator:
+    """
+    Builds contingency tables for pairs of categorical columns from an iterator of DataFrame chunks (for instance
+    pd.read_sql(..., chunksize=...) or one parquet partition at a time), so memory is bounded by the cardinality of
+    the columns rather than the number of rows. Accumulators built in separate processes can be combined with merge.
+
+    >>> acc = ContingencyAccumulator(columns=['a', 'b', 'c'])
+    >>> for chunk in pd.read_sql(query, engine, chunksize=100000):
+    ...     acc.update(chunk)
+    >>> acc.result('theils_u')
+    """
+
+    def __init__(self, columns=None, pairs=None):
+        import itertools
+
+        if pairs is None:
+            if columns is None:
+                raise ValueError("Expecting either columns or pairs")
+            pairs = itertools.combinations(columns, 2)
+
+        self._pairs = [tuple(pair) for pair in pairs]
+        self._levels = {col: {} for pair in self._pairs for col in pair}
+        self._tables = {pair: np.zeros((0, 0), dtype=np.int64) for pair in self._pairs}
+        self._rows = 0
+
+    def _encode(self, series):
+        # maps a chunk's values on to the codes seen so far, giving new values (and missing, as None) new codes
+        levels = self._levels[series.name]
+        local_codes, uniques = pd.factorize(series)
+        keys = list(uniques) + [None]
+        remap = np.empty(len(keys), dtype=np.intp)
+        for i, key in enumerate(keys):
+            remap[i] = levels.setdefault(key, len(levels))
+
+        return remap[local_codes]
+
+    def _add(self, pair, table):
+        current = self._tables[pair]
+        rows, cols = len(self._levels[pair[0]]), len(self._levels[pair[1]])
+        if current.shape != (rows, cols):
+            current = np.pad(current, ((0, rows - current.shape[0]), (0, cols - current.shape[1])), 'constant')
+
+        self._tables[pair] = current + table
+
+    def update(self, chunk: pd.DataFrame):
+        codes = {col: self._encode(chunk[col]) for col in self._levels.keys()}
+        for x, y in self._pairs:
+            rows, cols = len(self._levels[x]), len(self._levels[y])
+            table = np.bincount(codes[x] * cols + codes[y], minlength=rows * cols).reshape(rows, cols)
+            self._add((x, y), table)
+
+        self._rows += len(chunk)
+        return self
+
+    def merge(self, other):
+        """Adds the counts of another accumulator over the same pairs (e.g. one built in a worker process)."""
+        remaps = {}
+        for col, other_levels in other._levels.items():
+            levels = self._levels[col]
+            remaps[col] = np.array([levels.setdefault(key, len(levels)) for key in other_levels.keys()],
+                                   dtype=np.intp)
+
+        for x, y in self._pairs:
+            table = np.zeros((len(self._levels[x]), len(self._levels[y])), dtype=np.int64)
+            table[np.ix_(remaps[x], remaps[y])] = other._tables[(x, y)]
+            self._add((x, y), table)
+
+        self._rows += other._rows
+        return self
+
+    def __len__(self):
+        return self._rows
+
+    def table(self, x, y, dropna=False) -> pd.DataFrame:
+        """The joint counts of x (rows) and y (columns) seen so far."""
+        table = self._tables[(x, y)] if (x, y) in self._tables else self._tables[(y, x)].T
+        index = pd.Index(list(self._levels[x].keys()), name=x, dtype=object)
+        columns = pd.Index(list(self._levels[y].keys()), name=y, dtype=object)
+        if dropna:
+            # as pd.crosstab would: no missing level, and no levels that were only seen alongside a missing value
+            rows = np.array([key is not None for key in index])
+            cols = np.array([key is not None for key in columns])
+            table = table[np.ix_(rows, cols)]
+            index, columns = index[rows], columns[cols]
+            rows, cols = table.sum(axis=1) > 0, table.sum(axis=0) > 0
+            table = table[np.ix_(rows, cols)]
+            index, columns = index[rows], columns[cols]
+
+        return pd.DataFrame(table, index=index, columns=columns)
+
+    def cramers_v(self, x, y):
+        return cramers_v_table(self.table(x, y, dropna=True).values)
+
+    def theils_u(self, x, y):
+        return theils_u_table(self.table(x, y).values)[0]
+
+    def conditional_entropy(self, x, y):
+        return conditional_entropy_table(self.table(x, y).values)
+
+    def result(self, method='theils_u') -> pd.DataFrame:
+        """The x/y/value DataFrame over every pair, for 'cramers_v', 'theils_u' or 'conditional_entropy'."""
+        methods = {'cramers_v': self.cramers_v, 'theils_u': self.theils_u,
+                   'conditional_entropy': self.conditional_entropy}
+        if method not in methods:
+            raise ValueError("Expecting one of {} for method".format(", ".join(methods.keys())))
+
+        return pd.DataFrame([{'x': x, 'y': y, 'value': methods[method](x, y)} for x, y in self._pairs],
+                            columns=['x', 'y', 'value'])
+
+
+def accumulate(chunks, columns=None, pairs=None) -> ContingencyAccumulator:
+    acc = ContingencyAccumulator(columns=columns, pairs=pairs)
+    for chunk in chunks:
+        acc.update(chunk)
+
+    return acc
+
+
+def _theils_u_shared(pair):
+    x, y = pair
+    store = attached()
+    table = contingency(*_missing_as_level(store.values(x), len(store.levels(x))),
+                        *_missing_as_level(store.values(y), len(store.levels(y))))
+    return x, y, theils_u_table(table)
+
+
+def theils_u_matrix(df, columns=None, processes=None):
+    """
+    Calculates Theil's U for every pair of categorical columns. Each column is factorized once, and both U(x,y) and
+    U(y,x) come from the same contingency table.
+    :param df: Pandas DataFrame
+    :param columns: the columns to include, defaults to the categorical columns of df
+    :param processes: if given, pairs are spread over a pool of this many workers reading the codes from a
+        shared ColumnStore
+    :return: Pandas DataFrame, where the value at [x, y] is U(x,y)
+    """
+    import itertools
+
+    if columns is None:
+        columns = datatype.schema(df).columns_of('categorical')
+
+    matrix = pd.DataFrame(np.eye(len(columns)), index=columns, columns=columns)
+    if processes is None:
+        factorized = {col: factorize(df[col]) for col in columns}
+        for x, y in itertools.combinations(columns, 2):
+            table = contingency(*factorized[x], *factorized[y])
+            matrix.at[x, y], matrix.at[y, x] = theils_u_table(table)
+    else:
+        with shared_pool(df, columns, processes) as (pool, _):
+            for x, y, (u_xy, u_yx) in pool.imap_unordered(_theils_u_shared, itertools.combinations(columns, 2),
+                                                           chunksize=16):
+                matrix.at[x, y], matrix.at[y, x] = u_xy, u_yx
+
+    return matrix
+
+
+def _search_row(x, columns, entropies, codes, k, threshold):
+    import heapq
+
+    s_x = entropies[x]
+
+    def bound(y):
+        # U(x,y) = I(x;y) / S(x), and I(x;y) <= S(y)
+        return 1. if s_x == 0 else min(1., entropies[y] / s_x)
+
+    found = []
+    for y in sorted((col for col in columns if col != x), key=bound, reverse=True):
+        limit = bound(y)
+        if threshold is not None and limit < threshold:
+            break
+        if k is not None and len(found) == k and found[0][0] >= limit:
+            break
+
+        u_xy, _ = theils_u_table(contingency(*codes(x), *codes(y)))
+        if threshold is not None and u_xy < threshold:
+            continue
+
+        if k is None:
+            found.append((u_xy, y))
+        elif len(found) < k:
+            heapq.heappush(found, (u_xy, y))
+        else:
+            heapq.heappushpop(found, (u_xy, y))
+
+    return [{'x': x, 'y': y, 'value': value} for value, y in sorted(found, reverse=True)]
+
+
+def _search_shared(x, k, threshold):
+    store = attached()
+    # the entropies of every column, sent once to each worker by shared_pool
+    return _search_row(x, store.columns, attached_state(),
+                       lambda col: _missing_as_level(store.values(col), len(store.levels(col))), k, threshold)
+
+
+def _search_records(df, columns, k, threshold, processes):
+    factorized = {col: factorize(df[col]) for col in columns}
+    entropies = {col: _entropy(np.bincount(_widen(codes, levels), minlength=levels))
+                 for col, (codes, levels) in factorized.items()}
+
+    if processes is None:
+        for x in columns:
+            yield from _search_row(x, columns, entropies, factorized.get, k, threshold)
+    else:
+        del factorized
+        with shared_pool(df, columns, processes, state=entropies) as (pool, _):
+            for records in pool.imap_unordered(partial(_search_shared, k=k, threshold=threshold), columns):
+                yield from records
+
+
+def search(df, k=None, threshold=None, columns=None, processes=None, as_sparse=False):
+    """
+    Finds the strongest Theil's U associations without materializing every pair: the top k y for each x by U(x,y),
+    and/or every U(x,y) at or above threshold. Candidates are visited in order of the upper bound S(y)/S(x), so
+    that once the bound falls below the threshold (or the smallest of the k best so far) the rest are skipped.
+    :param df: Pandas DataFrame
+    :param k: the number of associations to keep per column
+    :param threshold: the smallest association to keep
+    :param columns: defaults to the categorical columns of df
+    :param processes: if given, columns are spread over a pool of this many workers reading from a ColumnStore
+    :param as_sparse: return (scipy.sparse.csr_matrix, columns) rather than a generator of x/y/value records
+    """
+    if k is None and threshold is None:
+        raise ValueError("Expecting k and/or threshold")
+    if k is not None and k < 1:
+        raise ValueError("Expecting k of at least 1")
+
+    if columns is None:
+        columns = datatype.schema(df).columns_of('categorical')
+
+    records = _search_records(df, columns, k, threshold, processes)
+    if not as_sparse:
+        return records
+
+    import scipy.sparse
+    position = {col: i for i, col in enumerate(columns)}
+    rows, cols, values = [], [], []
+    for record in records:
+        rows.append(position[record['x']])
+        cols.append(position[record['y']])
+        values.append(record['value'])
+
+    return scipy.sparse.csr_matrix((values, (rows, cols)), shape=(len(columns), len(columns))), columns
+
+
+def to_long(matrix, columns=None):
+    """
+    Flattens an association matrix into the x/y/value DataFrame, one row per pair of columns in combination order.
+    """
+    import itertools
+
+    if columns is None:
+        columns = matrix.columns.tolist()
+
+    values = matrix.values
+    position = {col: i for i, col in enumerate(matrix.columns)}
+    return pd.DataFrame([{'x': x, 'y': y, 'value': values[position[x], position[y]]}
+                         for x, y in itertools.combinations(columns, 2)], columns=['x', 'y', 'value'])
+
+
+_MIN_CELL_COUNT = 5
+
+
+def _entropies(counts, axis):
+    # entropy of each distribution along axis, for a stack of count arrays, with the Miller-Madow correction
+    # (occupied cells - 1) / 2n for the downward bias of the plug-in estimate on a sample
+    total = counts.sum(axis=axis, keepdims=True)
+    occupied = (counts > 0).sum(axis=axis)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = counts / total
+        plug_in = -np.sum(np.where(p > 0, p * np.log(p), 0), axis=axis)
+        return plug_in + np.where(occupied > 0, (occupied - 1) / (2. * total.squeeze(axis)), 0)
+
+
+def _theils_u_sample(x, y, random, n_boot):
+    x_codes, x_levels = x
+    y_codes, y_levels = y
+    table = contingency(x_codes, x_levels, y_codes, y_levels)
+    # resampling rows with replacement is a multinomial draw over the cells of the table
+    tables = random.multinomial(len(x_codes), table.ravel() / len(x_codes), size=n_boot)
+    tables = np.concatenate([table.reshape(1, -1), tables]).reshape(-1, x_levels, y_levels)
+    s_x = _entropies(tables.sum(axis=2), axis=1)
+    s_y = _entropies(tables.sum(axis=1), axis=1)
+    s_joint = _entropies(tables.reshape(len(tables), -1), axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        u = np.clip(np.where(s_x == 0, 1, (s_x - (s_joint - s_y)) / s_x), 0, 1)
+    # until the sample fills the table's cells, even the corrected estimate is biased upwards
+    min_size = _MIN_CELL_COUNT * np.count_nonzero(table.sum(axis=1)) * np.count_nonzero(table.sum(axis=0))
+    return u[0], u[1:], min_size
+
+
+def _pearson_sample(x, y, random, n_boot):
+    present = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[present], y[present]
+    if len(x) < 3:
+        return np.nan, np.array([0, 1]), 0
+
+    index = np.concatenate([np.arange(len(x)).reshape(1, -1), random.randint(0, len(x), (n_boot, len(x)))])
+    xs, ys = x[index], y[index]
+    xs = xs - xs.mean(axis=1, keepdims=True)
+    ys = ys - ys.mean(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = np.abs(np.sum(xs * ys, axis=1) / np.sqrt(np.sum(xs * xs, axis=1) * np.sum(ys * ys, axis=1)))
+    return r[0], np.nan_to_num(r[1:]), 0
+
+
+def screen(df, threshold, columns=None, method='theils_u', initial_size=1000, max_size=100000, n_boot=50,
+           confidence=0.95, random_state=None):
+    """
+    Estimates the association of every pair of columns on progressively larger random samples of the rows, with
+    bootstrap confidence intervals, and stops sampling a pair as soon as its interval lies wholly above or below the
+    threshold. Pairs clearly below the threshold are dropped; the rest are worth an exact computation. Theil's U is
+    estimated from Miller-Madow corrected entropies, and the intervals are basic (bias corrected) bootstrap ones. A
+    pair is only settled as above the threshold once the sample averages 5 rows per cell of its contingency table,
+    as U is still biased upwards on smaller samples.
+    :param df: Pandas DataFrame
+    :param threshold: the association of interest, U(x,y) for 'theils_u' or |r| for 'pearson'
+    :param columns: defaults to the categorical columns for 'theils_u' and the continuous columns for 'pearson'
+    :param initial_size: rows in the first sample, which doubles at each round up to max_size (or all the rows)
+    :return: Pandas DataFrame of x/y/value with the lower and upper bounds and the sample size behind the estimate
+    """
     import itertools
 
+    methods = {'theils_u': ('categorical', factorize, lambda col, index: (col[0][index], col[1]),
+                            _theils_u_sample),
+               'pearson': ('float', datatype.float_values,
+                           lambda col, index: col[index], _pearson_sample)}
+    if method not in methods:
+        raise ValueError("Expecting one of {} for method".format(", ".join(methods.keys())))
+
+    kind, encode, take, estimate = methods[method]
+    if columns is None:
+        columns = datatype.schema(df).columns_of(kind)
+
+    random = np.random.RandomState(random_state)
+    max_size = min(max_size, len(df))
+    # a prefix of a random permutation is a uniform sample, so each round extends the one before
+    order = random.permutation(len(df))[:max_size]
+    # only the sampled rows are encoded, in sample order, so each round takes a prefix of them
+    encoded = {col: encode(df[col].iloc[order]) for col in columns}
+    alpha = (1 - confidence) / 2
+
+    pending = list(itertools.combinations(columns, 2))
     results = []
-    with mp.Pool(mp.cpu_count()-1) as pool:
-        for resp in pool.imap(partial(_process, method=theils_u), ((df[tpl[0]], df[tpl[1]])
-                                               for tpl in itertools.combinations(datatype.get_categorical(df).columns, 2))):
-            results.append(resp)
+    size = min(initial_size, max_size)
+    while len(pending) > 0:
+        sample = {col: take(encoded[col], slice(0, size)) for col in columns}
+        undecided = []
+        for x, y in pending:
+            value, boot, min_size = estimate(sample[x], sample[y], random, n_boot)
+            # the basic bootstrap interval, which takes off the bias the resamples show as well as their spread
+            lower, upper = 2 * value - np.quantile(boot, [1 - alpha, alpha])
+            record = {'x': x, 'y': y, 'value': value, 'lower': lower, 'upper': upper, 'sample_size': size}
+            if upper < threshold:
+                continue
+            elif (lower > threshold and size >= min_size) or size == max_size:
+                results.append(record)
+            else:
+                undecided.append((x, y))
 
-    return pd.DataFrame(results)
+        pending = undecided
+        size = min(size * 2, max_size)
+
+    return pd.DataFrame(results, columns=['x', 'y', 'value', 'lower', 'upper', 'sample_size'])
+
+
+def cached_matrix(df, cache: AssociationCache, method='theils_u', columns=None, processes=None):
+    """
+    As theils_u_matrix or pearson_matrix, but looks each pair up in the cache by the fingerprints of its two columns
+    first, so that only pairs involving new or changed columns are computed (and then added to the cache). The
+    columns of the missed pairs are computed together, with theils_u_matrix or pearson_matrix.
+    :param cache: an AssociationCache
+    :param method: 'theils_u' or 'pearson'
+    :param processes: passed on to theils_u_matrix
+    :return: the U matrix for 'theils_u', or the (r, p) matrices for 'pearson'
+    """
+    import itertools
 
-def continuous(df):
+    # the kind of column, and the cached pair of values at [i, j] of the computed matrices: U(x,y) and U(y,x), or r
+    # and p (which are symmetric)
+    methods = {'theils_u': ('categorical', lambda cols: (theils_u_matrix(df, cols, processes).values,),
+                            lambda matrices, i, j: (matrices[0][i, j], matrices[0][j, i])),
+               'pearson': ('float', lambda cols: tuple(matrix.values for matrix in pearson_matrix(df, cols)),
+                           lambda matrices, i, j: (matrices[0][i, j], matrices[1][i, j]))}
+    if method not in methods:
+        raise ValueError("Expecting one of {} for method".format(", ".join(methods.keys())))
+
+    kind, compute, pair_values = methods[method]
+    if columns is None:
+        columns = datatype.schema(df).columns_of(kind)
+
+    fingerprints = {col: fingerprint(df[col]) for col in columns}
+    keys = {}
+    for x, y in itertools.combinations(columns, 2):
+        # keyed in fingerprint order, so the same two columns hit whichever way round they come
+        first, second = (y, x) if fingerprints[x] > fingerprints[y] else (x, y)
+        keys[(first, second)] = cache.key(method, fingerprints[first], fingerprints[second])
+
+    found = cache.get_many(set(keys.values()))
+    missed = [pair for pair, key in keys.items() if key not in found]
+    if len(missed) > 0:
+        missed_columns = [col for col in columns if any(col in pair for pair in missed)]
+        position = {col: i for i, col in enumerate(missed_columns)}
+        matrices = compute(missed_columns)
+        computed = {keys[(x, y)]: pair_values(matrices, position[x], position[y]) for x, y in missed}
+        cache.put_many(computed)
+        found.update(computed)
+
+    position = {col: i for i, col in enumerate(columns)}
+    first = np.eye(len(columns))
+    second = np.zeros((len(columns), len(columns)))
+    for (x, y), key in keys.items():
+        i, j = position[x], position[y]
+        if method == 'theils_u':
+            first[i, j], first[j, i] = found[key]
+        else:
+            first[i, j] = first[j, i] = found[key][0]
+            second[i, j] = second[j, i] = found[key][1]
+
+    if method == 'theils_u':
+        return pd.DataFrame(first, index=columns, columns=columns)
+
+    return pd.DataFrame(first, index=columns, columns=columns), pd.DataFrame(second, index=columns, columns=columns)
+
+
+def categorical(df, as_matrix=False, processes=None, threshold=None, random_state=None, cache=None):
+    """
+    Theil's U for every pair of categorical columns, as the x/y/value DataFrame.
+    :param threshold: if given, only screen the pairs on samples of the rows and return those that may reach it
+        (see screen)
+    :param cache: an AssociationCache, so that only pairs with new or changed columns are recomputed
+    """
+    if threshold is not None:
+        return screen(df, threshold, method='theils_u', random_state=random_state)
+
+    if cache is not None:
+        matrix = cached_matrix(df, cache, method='theils_u', processes=processes)
+    else:
+        matrix = theils_u_matrix(df, processes=processes)
+    if as_matrix:
+        return matrix
+
+    return to_long(matrix)
+
+def pearson_matrix(df, columns=None):
+    """
+    Calculates Pearson's r and its two-sided p-value for every pair of continuous columns with matrix products. Rows
+    with a NaN in either column are left out of that pair only (pairwise-complete), as pearsonr on the pair would see.
+    :param df: Pandas DataFrame
+    :param columns: the columns to include, defaults to the float columns of df
+    :return: (r, p), both Pandas DataFrames indexed by column on each axis
+    """
+    if columns is None:
+        columns = datatype.schema(df).columns_of('float')
+
+    x = np.column_stack([datatype.float_values(df[col]) for col in columns]) if len(columns) else \
+        np.empty((len(df), 0))
+    present = ~np.isnan(x)
+    # centring on each column's own mean first keeps the sums of squares below well conditioned
+    x = np.where(present, x - np.nanmean(x, axis=0), 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if present.all():
+            n = np.full((len(columns), len(columns)), float(len(x)))
+            x /= np.sqrt((x * x).sum(axis=0))
+            r = x.T @ x
+        else:
+            mask = present.astype(np.float64)
+            n = mask.T @ mask
+            sums = x.T @ mask
+            squares = (x * x).T @ mask
+            cov = x.T @ x - sums * sums.T / n
+            var = squares - sums * sums / n
+            r = cov / np.sqrt(var * var.T)
+
+        r = np.clip(r, -1, 1)
+        dof = n - 2
+        t = np.abs(r) * np.sqrt(dof / (1 - r * r))
+        p = 2 * ss.t.sf(t, dof)
+
+    p[np.abs(r) == 1] = 0
+    p[dof < 1] = np.nan
+    return pd.DataFrame(r, index=columns, columns=columns), pd.DataFrame(p, index=columns, columns=columns)
+
+
+def continuous(df, vectorized=True, as_matrix=False, threshold=None, random_state=None, cache=None):
+    """
+    Pearson's r and p-value for every pair of continuous columns, as the x/y/value DataFrame with (r, p) values.
+    :param vectorized: compute every pair at once with pearson_matrix, rather than pearsonr per pair in a pool
+    :param as_matrix: return the (r, p) matrices instead (vectorized only)
+    :param threshold: if given, only screen the pairs on samples of the rows and return those whose |r| may reach it
+        (see screen)
+    :param cache: an AssociationCache, so that only pairs with new or changed columns are recomputed
+    """
     import itertools
+    if threshold is not None:
+        return screen(df, threshold, method='pearson', random_state=random_state)
+
+    columns = pd.Index(datatype.schema(df).columns_of('float'))
+    if vectorized or cache is not None:
+        if cache is not None:
+            r, p = cached_matrix(df, cache, method='pearson', columns=columns.tolist())
+        else:
+            r, p = pearson_matrix(df, columns.tolist())
+        if as_matrix:
+            return r, p
+
+        return pd.DataFrame([{'x': x, 'y': y, 'value': (r.at[x, y], p.at[x, y])}
+                             for x, y in itertools.combinations(columns, 2)], columns=['x', 'y', 'value'])
+
     results = []
-    with mp.Pool(mp.cpu_count() - 1) as pool:
-        for resp in pool.imap(partial(_process, method=ss.pearsonr), ((df[tpl[0]], df[tpl[1]])
-                                             for tpl in itertools.combinations(datatype.get_continuous(df).columns, 2))):
+    with shared_pool(df, columns) as (pool, _):
+        for resp in pool.imap(partial(_process_shared, method=ss.pearsonr), itertools.combinations(columns, 2)):
             results.append(resp)
 
     return pd.DataFrame(results)
+
+
+def _association(x, y, codes, floats):
+    # codes gives the factorized codes of a categorical column (None for a continuous one), floats the values of a
+    # continuous one
+    x_codes, y_codes = codes(x), codes(y)
+    if x_codes is not None and y_codes is not None:
+        return x, y, theils_u_table(contingency(*x_codes, *y_codes))
+
+    if x_codes is None:
+        x, y, x_codes = y, x, y_codes
+
+    eta = correlation_ratio_codes(*x_codes, floats(y))
+    return x, y, (eta, eta)
+
+
+def _association_shared(pair):
+    store = attached()
+    return _association(*pair,
+                        lambda col: _missing_as_level(store.values(col), len(store.levels(col)))
+                        if store.is_encoded(col) else None,
+                        lambda col: store.values(col).astype(np.float64))
+
+
+def associations(df, as_matrix=False, processes=None):
+    """
+    Association between every pair of categorical and continuous columns: Theil's U for categorical-categorical,
+    Pearson's r for continuous-continuous and the correlation ratio for mixed pairs. The pairs needing a pass over the
+    rows are spread across a single worker pool, the most expensive (by cardinality x rows) first.
+    :param df: Pandas DataFrame
+    :param as_matrix: return the square matrix rather than the x/y/value DataFrame
+    :param processes: the size of the worker pool, defaults to one less than the number of cpus. With 1 the pairs are
+        worked out in this process.
+    """
+    import itertools
+
+    categorical_columns = datatype.schema(df).columns_of('categorical')
+    continuous_columns = datatype.schema(df).columns_of('float')
+    columns = categorical_columns + continuous_columns
+
+    matrix = pd.DataFrame(np.eye(len(columns)), index=columns, columns=columns)
+    if len(continuous_columns) > 0:
+        r, _ = pearson_matrix(df, continuous_columns)
+        matrix.loc[continuous_columns, continuous_columns] = r.values
+
+    cardinality = {col: len(df[col].cat.categories) + 1 for col in categorical_columns}
+    cardinality.update({col: 1 for col in continuous_columns})
+    pairs = [(x, y) for x, y in itertools.combinations(columns, 2)
+             if x in categorical_columns or y in categorical_columns]
+    # longest first, so that the expensive pairs aren't left running on their own at the end
+    pairs.sort(key=lambda pair: len(df) * cardinality[pair[0]] * cardinality[pair[1]], reverse=True)
+
+    if processes == 1:
+        codes = {col: factorize(df[col]) for col in categorical_columns}
+        for x, y, (u_xy, u_yx) in (_association(x, y, codes.get, lambda col: datatype.float_values(df[col]))
+                                   for x, y in pairs):
+            matrix.at[x, y], matrix.at[y, x] = u_xy, u_yx
+    elif len(pairs) > 0:
+        with shared_pool(df, columns, processes) as (pool, _):
+            for x, y, (u_xy, u_yx) in pool.imap_unordered(_association_shared, pairs):
+                matrix.at[x, y], matrix.at[y, x] = u_xy, u_yx
+
+    if as_matrix:
+        return matrix
+
+    return to_long(matrix)
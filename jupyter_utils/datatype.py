@@ -1,49 +1,129 @@
+import weakref
 import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+_StringDtype = getattr(pd, "StringDtype", None)
+_CATEGORY = "category"
+
+
+def _kind(dtype):
+    # numpy's kind for numpy dtypes and for pandas' nullable/tz-aware ones, with _CATEGORY for categoricals (which
+    # is not a numpy kind, unlike "c" for complex) and None for the other extension dtypes (e.g. period, interval)
+    if isinstance(dtype, CategoricalDtype) or (isinstance(dtype, str) and dtype == _CATEGORY):
+        return _CATEGORY
+    if _StringDtype is not None and isinstance(dtype, _StringDtype):
+        return "O"
+
+    try:
+        return np.dtype(dtype).kind
+    except TypeError:
+        kind = getattr(dtype, "kind", None)
+        return kind if kind != "O" else None
 
 
 def is_numeric(dtype):
     return is_float(dtype) or is_int(dtype)
 
 def is_float(dtype):
-    return str(dtype) in {"float32", "float64"}
+    return _kind(dtype) == "f"
 
 def is_int(dtype):
-    return str(dtype) in {"int32", "int64", "uint32", "uint64"}
+    return _kind(dtype) in {"i", "u"}
 
 def is_bool(dtype):
-    return str(dtype) == "bool"
+    return _kind(dtype) == "b"
 
 def is_string(dtype):
-    return str(dtype) == "object" or str(dtype) == "O"
+    return _kind(dtype) in {"O", "U", "S"}
 
 def is_timestamp(dtype):
-    for ts in ['timestamp64', 'timedelta64', 'datetime64']:
-        if ts in str(dtype):
-            return True
+    return _kind(dtype) in {"M", "m"}
+
+def is_categorical(dtype):
+    return _kind(dtype) == _CATEGORY
+
+
+def float_values(col) -> np.ndarray:
+    """The values of a numeric column as a float64 array, with the pd.NA of nullable (extension) columns as NaN."""
+    if isinstance(col.values, np.ndarray):
+        return col.values.astype(np.float64, copy=False)
+
+    return col.to_numpy(np.float64, na_value=np.nan)
 
-    return False
 
 def could_be_int(col):
     if is_int(col.dtype):
         return True
 
     if is_float(col.dtype):
-        for val in col.dropna().unique():
-            if int(val) != val:
-                return False
-
-        return True
+        values = float_values(col)
+        values = values[~np.isnan(values)]
+        fractional, _ = np.modf(values)
+        return bool(np.isfinite(values).all() and not fractional.any())
 
     return False
 
 
+def classify(dtype):
+    """One of 'bool', 'int', 'float', 'categorical', 'string', 'timestamp' or 'other'."""
+    for kind, check in (('categorical', is_categorical), ('bool', is_bool), ('int', is_int), ('float', is_float),
+                        ('timestamp', is_timestamp), ('string', is_string)):
+        if check(dtype):
+            return kind
+
+    return 'other'
+
+
+class Schema:
+    """
+    The classification of every column of a frame from its dtype. Only facts that follow from the dtypes are kept, so
+    integrality (which depends on the values) is worked out on every call. Use schema(df) to get the one cached for a
+    frame.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self._columns = df.columns.tolist()
+        self._dtypes = df.dtypes.tolist()
+        self._frame = weakref.ref(df)
+        self.kinds = {col: classify(dtype) for col, dtype in zip(self._columns, self._dtypes)}
+
+    def matches(self, df: pd.DataFrame):
+        return self._frame() is df and df.columns.tolist() == self._columns and df.dtypes.tolist() == self._dtypes
+
+    def columns_of(self, *kinds):
+        return [col for col in self._columns if self.kinds[col] in kinds]
+
+    def could_be_int(self, col):
+        return could_be_int(self._frame()[col])
+
+
+_schemas = {}
+
+
+def schema(df: pd.DataFrame, refresh=False) -> Schema:
+    """
+    The Schema of df, kept until the frame is garbage collected and rebuilt whenever its columns or dtypes have
+    changed (or when refresh is set, e.g. after values were changed in place).
+    """
+    key = id(df)
+    cached = _schemas.get(key)
+    if refresh or cached is None or not cached.matches(df):
+        if cached is None or cached._frame() is not df:
+            weakref.finalize(df, _schemas.pop, key, None)
+        cached = Schema(df)
+        _schemas[key] = cached
+
+    return cached
+
+
 def get_categorical(df):
-    return df.select_dtypes(['category'])
+    return df[schema(df).columns_of('categorical')]
 
 
 def get_continuous(df):
-    return df[[col for col in df.columns if is_float(df[col].dtype)]]
+    return df[schema(df).columns_of('float')]
 
 
 def get_bool(df):
-    return df.select_dtypes(['bool'])
\ No newline at end of file
+    return df[schema(df).columns_of('bool')]
@@ -7,6 +7,8 @@ from pandas.api.types import is_string_dtype, is_numeric_dtype
 from sklearn.ensemble import forest
 from sklearn.tree import export_graphviz
 import re, numpy as np
+from jupyter_utils.features import dateparts
+import jupyter_utils.sample
 #import graphviz
 
 
@@ -73,8 +75,7 @@ def get_sample(df,n):
     1     2    b
     2     3    a
     """
-    idxs = sorted(np.random.permutation(len(df))[:n])
-    return df.iloc[idxs].copy()
+    return jupyter_utils.sample.get_sample(df, n).copy()
 
 def add_datepart(df, fldname, drop=True, time=False):
     """add_datepart converts a column of df from a datetime64 to many columns containing
@@ -115,11 +116,9 @@ def add_datepart(df, fldname, drop=True, time=False):
     if not np.issubdtype(fld_dtype, np.datetime64):
         df[fldname] = fld = pd.to_datetime(fld, infer_datetime_format=True)
     targ_pre = re.sub('[Dd]ate$', '', fldname)
-    attr = ['Year', 'Month', 'Week', 'Day', 'Dayofweek', 'Dayofyear',
-            'Is_month_end', 'Is_month_start', 'Is_quarter_end', 'Is_quarter_start', 'Is_year_end', 'Is_year_start']
-    if time: attr = attr + ['Hour', 'Minute', 'Second']
-    for n in attr: df[targ_pre + n] = getattr(fld.dt, n.lower())
-    df[targ_pre + 'Elapsed'] = fld.astype(np.int64) // 10 ** 9
+    parts = dateparts(fld, prefix=targ_pre, time=time)
+    # df is changed in place, so the precomputed parts go in a column at a time
+    for col in parts.columns: df[col] = parts[col].values
     if drop: df.drop(fldname, axis=1, inplace=True)
 
 def is_date(x): return np.issubdtype(x.dtype, np.datetime64)
@@ -169,7 +168,8 @@ def apply_cats(df, trn):
 
     trn: A pandas dataframe. When creating a category for df, it looks up the
         what the category's code were in trn and makes those the category codes
-        for df.
+        for df. Can also be a fitted convert.CategoryEncoder, so the training
+        frame need not be kept around.
 
     Examples:
     ---------
@@ -202,11 +202,16 @@ def apply_cats(df, trn):
 
     now the type of col is category {a : 1, b : 2}
     """
+    from jupyter_utils.convert import CategoryEncoder
+    if isinstance(trn, CategoryEncoder):
+        trn.transform(df)
+        return
+
     for n,c in df.items():
         if (n in trn.columns) and (trn[n].dtype.name=='category'):
             df[n] = pd.Categorical(c, categories=trn[n].cat.categories, ordered=True)
 
-def fix_missing(df, col, name, na_dict):
+def fix_missing(df, col, name, na_dict, indicators=None):
     """ Fill missing data in a column of df with the median, and add a {name}_na column
     which specifies if the data was missing.
 
@@ -223,6 +228,9 @@ def fix_missing(df, col, name, na_dict):
         if name is not a key of na_dict and there is no missing data in col, then
         no {name}_na column is not created.
 
+    indicators: A missing.MissingIndicators. If given, the {name}_na column is
+        recorded there (packed) rather than added to df.
+
 
     Examples:
     ---------
@@ -272,7 +280,8 @@ def fix_missing(df, col, name, na_dict):
     """
     if is_numeric_dtype(col):
         if pd.isnull(col).sum() or (name in na_dict):
-            df[name+'_na'] = pd.isnull(col)
+            if indicators is not None: indicators.add(name+'_na', pd.isnull(col))
+            else: df[name+'_na'] = pd.isnull(col)
             filler = na_dict[name] if name in na_dict else col.median()
             df[name] = col.fillna(filler)
             na_dict[name] = filler
@@ -1,27 +1,154 @@
 import jupyter_utils.datatype
 import numpy as np
 import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype
 
 
-def remove_variable_variables(df: pd.DataFrame):
-    column_names = df.select_dtypes(include=['object', 'categorical']).apply(lambda x: len(x.unique()) != len(df))
-    return df[column_names[column_names == True].index.tolist()].copy()
+def _column_stats(series, approximate):
+    kind = jupyter_utils.datatype.classify(series.dtype)
+    nulls = int(series.isnull().sum())
+    if kind == 'categorical':
+        # the categories that occur (not all those declared), plus missing as a value as len(unique()) would count it
+        codes = series.cat.codes.values
+        return nulls, int(np.count_nonzero(np.bincount(codes[codes >= 0]))) + (nulls > 0), True, 0.
+    if approximate:
+        from jupyter_utils.sketch import HyperLogLog
+        sketch = HyperLogLog().update(series)
+        return nulls, sketch.count(), False, sketch.error
 
+    return nulls, len(series.unique()), True, 0.
 
-def remove_mostly_empty_variables(df: pd.DataFrame, cutoff=0.1):
-    length = len(df)
-    new_df = df.copy()
-    for column in df.columns.tolist():
-        if len(df[column].dropna()) / length <= cutoff:
-            new_df = new_df.drop(column, axis=1)
 
-    return new_df
+def column_stats(df: pd.DataFrame, approximate=False, threads=1) -> pd.DataFrame:
+    """
+    The null count, null ratio and number of distinct values (counting missing as one) of every column, in one pass
+    over the columns across threads. With approximate the distinct counts of non-categorical columns come from a
+    HyperLogLog sketch rather than unique(), the exact column is False and error is the sketch's relative standard
+    error (0 for exact counts).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    columns = df.columns.tolist()
+    with ThreadPoolExecutor(threads) as executor:
+        stats = list(executor.map(lambda col: _column_stats(df[col], approximate), columns))
+
+    stats = pd.DataFrame(stats, index=columns, columns=['nulls', 'distinct', 'exact', 'error'])
+    stats['null_ratio'] = stats['nulls'] / len(df) if len(df) > 0 else 0.
+    stats['kind'] = [jupyter_utils.datatype.classify(dtype) for dtype in df.dtypes]
+    return stats
+
+
+def _discrete(stats):
+    return stats[stats['kind'].isin(['string', 'categorical'])]
+
+
+def remove_variable_variables(df: pd.DataFrame, stats: pd.DataFrame=None):
+    if stats is None:
+        stats = column_stats(df)
+
+    discrete = _discrete(stats)
+    # an approximate count can't be compared exactly, so allow for three standard errors of a HyperLogLog
+    tolerance = 3 * discrete['error'].values * len(df)
+    return df[discrete.index[np.abs(discrete['distinct'] - len(df)) > tolerance].tolist()]
+
+
+def remove_mostly_empty_variables(df: pd.DataFrame, cutoff=0.1, stats: pd.DataFrame=None):
+    if stats is None:
+        stats = column_stats(df)
+
+    return df[stats.index[1 - stats['null_ratio'] > cutoff].tolist()]
+
 
+def remove_variables_too_much_variance(df: pd.DataFrame, num_states = 30, stats: pd.DataFrame=None):
+    if stats is None:
+        stats = column_stats(df)
 
-def remove_variables_too_much_variance(df: pd.DataFrame, num_states = 30):
-    column_names = df.select_dtypes(include=['object', 'category']).apply(lambda x: len(x.unique()) >= num_states)
-    cols = list(set(df.columns.tolist()) - set(column_names[column_names == True].index.tolist()))
-    return df[cols].copy()
+    discrete = _discrete(stats)
+    too_many = set(discrete.index[discrete['distinct'] >= num_states])
+    return df[[col for col in df.columns if col not in too_many]]
+
+
+_DATEPARTS = ['Year', 'Month', 'Week', 'Day', 'Dayofweek', 'Dayofyear', 'Is_month_end', 'Is_month_start',
+              'Is_quarter_end', 'Is_quarter_start', 'Is_year_end', 'Is_year_start']
+_TIMEPARTS = ['Hour', 'Minute', 'Second']
+_PART_DTYPES = {'Year': np.int16, 'Dayofyear': np.int16}
+
+
+def _decompose(values, local, out, time):
+    # values are the UTC nanoseconds (for Elapsed), local the wall clock datetime64[ns] the fields are taken from
+    days = local.astype('M8[D]')
+    months = local.astype('M8[M]')
+    years = local.astype('M8[Y]')
+    year = years.astype(np.int64) + 1970
+    month = months.astype(np.int64) - (year - 1970) * 12 + 1
+    day = (days - months.astype('M8[D]')).astype(np.int64) + 1
+    days_in_month = ((months + 1).astype('M8[D]') - months.astype('M8[D]')).astype(np.int64)
+    dayofweek = (days.astype(np.int64) + 3) % 7
+    # the ISO week is that of the week's Thursday, counted within the Thursday's year
+    thursday = days - dayofweek + 3
+    week = (thursday - thursday.astype('M8[Y]').astype('M8[D]')).astype(np.int64) // 7 + 1
+
+    out['Year'][:] = year
+    out['Month'][:] = month
+    out['Week'][:] = week
+    out['Day'][:] = day
+    out['Dayofweek'][:] = dayofweek
+    out['Dayofyear'][:] = (days - years.astype('M8[D]')).astype(np.int64) + 1
+    out['Is_month_end'][:] = day == days_in_month
+    out['Is_month_start'][:] = day == 1
+    out['Is_quarter_end'][:] = (day == days_in_month) & (month % 3 == 0)
+    out['Is_quarter_start'][:] = (day == 1) & (month % 3 == 1)
+    out['Is_year_end'][:] = (month == 12) & (day == 31)
+    out['Is_year_start'][:] = (month == 1) & (day == 1)
+    if time:
+        seconds = (local - days).astype('m8[s]').astype(np.int64)
+        out['Hour'][:] = seconds // 3600
+        out['Minute'][:] = seconds // 60 % 60
+        out['Second'][:] = seconds % 60
+    out['Elapsed'][:] = values // 10 ** 9
+
+
+def dateparts(series: pd.Series, prefix=None, time=False, chunk_size=1000000) -> pd.DataFrame:
+    """
+    The date parts of a datetime column as a frame of compact columns (int8/int16 fields, bool flags, int64 Elapsed
+    seconds), taken from one pass over the underlying int64 buffer, chunk_size rows at a time, rather than once per
+    field. Fields of tz-aware columns are in local time, as with series.dt. Fields of missing timestamps are NaN, which
+    makes those columns float32.
+
+    Parameters:
+    -----------
+    series: A datetime64 series.
+    prefix: Prepended to the part names, the series name followed by an underscore by default.
+    time: If true time features: Hour, Minute, Second will be added.
+    chunk_size: The number of rows decomposed at a time.
+    """
+    if prefix is None:
+        prefix = "{}_".format(series.name)
+
+    parts = _DATEPARTS + (_TIMEPARTS if time else [])
+    utc = series.dt.tz_convert('UTC').dt.tz_localize(None) if series.dt.tz is not None else series
+    local = series.dt.tz_localize(None) if series.dt.tz is not None else series
+    values = utc.values.astype('M8[ns]').view(np.int64)
+    local = local.values.astype('M8[ns]')
+    missing = np.isnat(local)
+
+    out = {part: np.empty(len(series), dtype=bool if part.startswith('Is_') else _PART_DTYPES.get(part, np.int8))
+           for part in parts}
+    out['Elapsed'] = np.empty(len(series), dtype=np.int64)
+    for start in range(0, len(series), chunk_size):
+        window = slice(start, start + chunk_size)
+        _decompose(values[window], local[window], {part: array[window] for part, array in out.items()}, time)
+
+    if missing.any():
+        for part in parts:
+            if part.startswith('Is_'):
+                out[part][missing] = False
+            else:
+                out[part] = out[part].astype(np.float32)
+                out[part][missing] = np.nan
+
+    return pd.DataFrame({prefix + part: out[part] for part in parts + ['Elapsed']}, index=series.index,
+                        columns=[prefix + part for part in parts + ['Elapsed']])
 
 
 def create_dateparts(df, drop=True, time=False):
@@ -55,13 +182,7 @@ def create_dateparts(df, drop=True, time=False):
     1   2000  3      10    12   6          72         False         False           False           False             False        False          952819200
     2   2000  3      11    13   0          73         False         False           False           False             False        False          952905600
     """
-    new_df = df.copy()
-    for series in [new_df[col] for col in df.columns if jupyter_utils.datatype.is_timestamp(new_df[col].dtype)]:
-        attr = ['Year', 'Month', 'Week', 'Day', 'Dayofweek', 'Dayofyear',
-                'Is_month_end', 'Is_month_start', 'Is_quarter_end', 'Is_quarter_start', 'Is_year_end', 'Is_year_start']
-        if time: attr = attr + ['Hour', 'Minute', 'Second']
-        for n in attr: new_df[series.name + "_" + n] = getattr(series.dt, n.lower())
-        new_df[series.name + '_Elapsed'] = series.astype(np.int64) // 10 ** 9
-        if drop: new_df.drop(series.name, axis=1, inplace=True)
-
-    return new_df
\ No newline at end of file
+    dates = [col for col in jupyter_utils.datatype.schema(df).columns_of('timestamp') if is_datetime64_any_dtype(df[col])]
+    parts = [dateparts(df[col], time=time) for col in dates]
+    kept = [col for col in df.columns if not (drop and col in dates)]
+    return pd.concat([df[kept]] + parts, axis=1)
\ No newline at end of file
@@ -5,31 +5,195 @@ import bayesianpy
 import numpy as np
 import jupyter_utils.datatype as datatype
 
-def find(df: pd.DataFrame):
+class MissingProfile:
+    """
+    Null counts of every column of a frame, with the positions of the nulls kept as packed bitmaps (one bit per row)
+    for the columns that have any. Built by profile(df), and accepted by the other functions here in place of
+    rescanning the frame with isnull().
+    """
+
+    def __init__(self, columns, length, counts, bitmaps):
+        self.columns = columns
+        self.length = length
+        self.counts = counts
+        self.bitmaps = bitmaps
+        self._co_missing = None
+
+    @property
+    def ratios(self) -> pd.Series:
+        return self.counts / self.length
+
+    def has_missing(self, col):
+        return self.counts.get(col, 0) > 0
+
+    def mask(self, col) -> np.ndarray:
+        """The rows of col that are null, as a bool array."""
+        if not self.has_missing(col):
+            return np.zeros(self.length, dtype=bool)
+
+        return np.unpackbits(self.bitmaps[col])[:self.length].astype(bool)
+
+    def co_missing(self, chunk_size=65536) -> pd.DataFrame:
+        """The number of rows in which each pair of columns (with any nulls) are both null."""
+        if self._co_missing is None:
+            columns = [col for col in self.columns if self.has_missing(col)]
+            counts = np.zeros((len(columns), len(columns)))
+            if len(columns) > 0:
+                packed = np.column_stack([self.bitmaps[col] for col in columns])
+                step = chunk_size // 8
+                for start in range(0, len(packed), step):
+                    block = np.unpackbits(packed[start:start + step], axis=0).astype(np.float32)
+                    counts += block.T @ block
+
+            self._co_missing = pd.DataFrame(counts.astype(np.int64), index=columns, columns=columns)
+
+        return self._co_missing
+
+
+class MissingIndicators:
+    """
+    Missing-indicator columns (such as {col}_missing) kept out of the frame: each is stored as the indices of its
+    null rows when they are few, or as a packed bitmap otherwise, and only materialized when asked for.
+
+    >>> indicators = MissingIndicators(len(df))
+    >>> filled = Impute(df, logger, indicators=indicators).fill_continuous()
+    >>> X = indicators.hstack(features)
+    """
+
+    def __init__(self, length):
+        self.length = length
+        self._indices = {}
+        self._bitmaps = {}
+        self.names = []
+
+    def add(self, name, col_is_missing):
+        col_is_missing = np.asarray(col_is_missing, dtype=bool)
+        indices = np.flatnonzero(col_is_missing)
+        # a 4 byte index per null row against a bit per row
+        if len(indices) * 32 < self.length:
+            self._indices[name] = indices.astype(np.int32 if self.length < 2 ** 31 else np.int64)
+        else:
+            self._bitmaps[name] = np.packbits(col_is_missing)
+
+        if name not in self.names:
+            self.names.append(name)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def indices(self, name) -> np.ndarray:
+        """The null rows of an indicator."""
+        if name in self._indices:
+            return self._indices[name]
+
+        return np.flatnonzero(self[name])
+
+    def __getitem__(self, name) -> np.ndarray:
+        if name in self._bitmaps:
+            return np.unpackbits(self._bitmaps[name])[:self.length].astype(bool)
+
+        col_is_missing = np.zeros(self.length, dtype=bool)
+        col_is_missing[self._indices[name]] = True
+        return col_is_missing
+
+    def to_frame(self, names=None, index=None) -> pd.DataFrame:
+        names = self.names if names is None else names
+        return pd.DataFrame({name: self[name] for name in names}, index=index, columns=names)
+
+    def to_sparse(self, names=None):
+        """The indicators as a length x len(names) scipy.sparse.csr_matrix."""
+        import scipy.sparse
+
+        names = self.names if names is None else names
+        rows = [self.indices(name) for name in names]
+        cols = [np.full(len(indices), i) for i, indices in enumerate(rows)]
+        rows = np.concatenate(rows) if len(rows) > 0 else np.array([], dtype=np.int64)
+        cols = np.concatenate(cols) if len(cols) > 0 else np.array([], dtype=np.int64)
+        return scipy.sparse.csr_matrix((np.ones(len(rows), dtype=np.uint8), (rows, cols)),
+                                       shape=(self.length, len(names)))
+
+    def hstack(self, features, names=None):
+        """Appends the indicators to a feature matrix (dense or sparse) as extra sparse columns."""
+        import scipy.sparse
+
+        return scipy.sparse.hstack([scipy.sparse.csr_matrix(features), self.to_sparse(names)], format='csr')
+
+
+def _indicate(df, name, col_is_missing, indicators):
+    if indicators is not None:
+        indicators.add(name, col_is_missing)
+    else:
+        df[name] = col_is_missing
+
+
+def _profile_block(df, columns):
+    nulls = df[columns].isnull().values
+    counts = nulls.sum(axis=0)
+    return columns, counts, {col: np.packbits(nulls[:, i]) for i, col in enumerate(columns) if counts[i] > 0}
+
+
+def profile(df: pd.DataFrame, block_size=64, threads=1) -> MissingProfile:
+    """
+    Scans df for nulls once, block_size columns at a time, optionally across threads (isnull releases the GIL on
+    numeric blocks).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    columns = df.columns.tolist()
+    blocks = [columns[i:i + block_size] for i in range(0, len(columns), block_size)]
+    counts, bitmaps = {}, {}
+    with ThreadPoolExecutor(threads) as executor:
+        for block, block_counts, block_bitmaps in executor.map(lambda block: _profile_block(df, block), blocks):
+            counts.update(zip(block, block_counts))
+            bitmaps.update(block_bitmaps)
+
+    return MissingProfile(columns, len(df), pd.Series(counts, index=columns, dtype=np.int64), bitmaps)
+
+
+def find(df: pd.DataFrame, profile: MissingProfile=None):
+    if profile is not None:
+        return profile.ratios.sort_index().sort_values(ascending=False)
+
     return (df.isnull().sum().sort_index() / len(df)).sort_values(ascending=False)
 
 
-def drop(df: pd.DataFrame):
-    x = find(df) == 1
+def drop(df: pd.DataFrame, profile: MissingProfile=None):
+    x = find(df, profile)
+    x = x[x == 1]
     return df.drop(x.index, axis=1)
 
-def mark_continuous(df):
+def mark_continuous(df, profile: MissingProfile=None, indicators: MissingIndicators=None):
+    """
+    Adds a {col}_missing column for each float column with nulls, or records it in indicators when given.
+    """
     new_df = df.copy()
-    for col in datatype.get_continuous(new_df).columns:
+    for col in datatype.schema(df).columns_of('float'):
+        if profile is not None:
+            if profile.has_missing(col):
+                _indicate(new_df, "{}_missing".format(col), profile.mask(col), indicators)
+            continue
+
         col_is_missing = pd.isnull(new_df[col])
         if any(col_is_missing == True):
-            new_df["{}_missing".format(col)] = col_is_missing
+            _indicate(new_df, "{}_missing".format(col), col_is_missing, indicators)
 
     return new_df
 
 
 class Impute:
-    def __init__(self, df: pd.DataFrame, logger: logging.Logger, mode='zerofill'):
+    def __init__(self, df: pd.DataFrame, logger: logging.Logger, mode='zerofill', profile: MissingProfile=None,
+                 indicators: MissingIndicators=None):
         super().__init__()
         self._df = df
         self._missing_indices = {}
         self._logger = logger
         self._mode = mode
+        self._profile = profile
+        # when given, the missing columns are recorded here rather than added to the frame
+        self._indicators = indicators
 
         self._actions = {'zerofill': lambda _df, _col: _df[_col].fillna(0),
                          'median': lambda _df, _col: _df[_col].fillna(_df[_col].median())}
@@ -37,17 +201,26 @@ class Impute:
         if mode not in self._actions:
             raise ValueError("Expecting one of {} for mode".format(", ".join(self._actions.keys())))
 
+    def _missing(self, df, col):
+        # the null rows of col, or None when there aren't any
+        if self._profile is not None:
+            return self._profile.mask(col) if self._profile.has_missing(col) else None
+
+        col_is_missing = pd.isnull(df[col])
+        return col_is_missing if col_is_missing.any() else None
+
     def fill_continuous(self, create_missing_cols=True):
         df = self._df.copy()
         for col in df.columns:
             if is_numeric_dtype(df[col]):
+                col_is_missing = self._missing(df, col)
+                if col_is_missing is None:
+                    continue
+
                 if create_missing_cols:
-                    col_is_missing = pd.isnull(df[col])
-                    if any(col_is_missing == True):
-                        df["{}_missing".format(col)] = col_is_missing
+                    _indicate(df, "{}_missing".format(col), col_is_missing, self._indicators)
 
-                if pd.isnull(df[col]).sum():
-                    df[col] = self._actions[self._mode](df, col)
+                df[col] = self._actions[self._mode](df, col)
 
         return df
 
@@ -55,13 +228,12 @@ class Impute:
         df = self._df.copy()
         for col in df.columns:
             if is_string_dtype(df[col]):
-                if create_missing_cols:
-                    col_is_missing = pd.isnull(df[col])
-                    if any(col_is_missing == True):
-                        df["{}_missing".format(col)] = col_is_missing
+                col_is_missing = self._missing(df, col)
+                if create_missing_cols and col_is_missing is not None:
+                    _indicate(df, "{}_missing".format(col), col_is_missing, self._indicators)
 
                 codes = df[col].cat.codes
-                if pd.isnull(df[col]).sum():
+                if col_is_missing is not None:
                     cats = df[col].cat.categories
                     cat_median = int(np.median(codes))
 
@@ -76,17 +248,207 @@ class Impute:
             self._df = df
 
         if mode == 'both' or mode == 'continuous':
-            df = self.fill_categorical(create_missing_cols=create_missing_cols)
+            df = self.fill_continuous(create_missing_cols=create_missing_cols)
 
         return df
 
+
+class FittedImpute:
+    """
+    Works out the fill value of every column once (fit, or fit_chunks for frames larger than memory), and then fills
+    any number of batches with them in place (transform), without copying the batch. Numeric columns are filled with
+    their median (mode='median') or 0 (mode='zerofill'); categorical and string columns with the category at the
+    median code (categorical='median') or the most frequent value (categorical='mode').
+
+    >>> imputer = FittedImpute().fit(train)
+    >>> for batch in batches:
+    ...     imputer.transform(batch)
+    """
+
+    def __init__(self, mode='median', categorical='median'):
+        if mode not in {'median', 'zerofill'}:
+            raise ValueError("Expecting one of median, zerofill for mode")
+        if categorical not in {'median', 'mode'}:
+            raise ValueError("Expecting one of median, mode for categorical")
+
+        self._mode = mode
+        self._categorical = categorical
+        self.fills = {}
+
+    def _categorical_fill(self, categories, counts):
+        # counts holds the number of rows with each category, in category order
+        if counts.sum() == 0:
+            return None
+        if self._categorical == 'mode':
+            return categories[int(np.argmax(counts))]
+
+        return categories[int(np.searchsorted(np.cumsum(counts), (counts.sum() + 1) / 2))]
+
+    def fit(self, df: pd.DataFrame):
+        info = datatype.schema(df)
+        numeric = info.columns_of('int', 'float')
+        if self._mode == 'median':
+            self.fills.update(df[numeric].median().to_dict())
+        else:
+            self.fills.update({col: 0 for col in numeric})
+
+        for col in info.columns_of('categorical', 'string'):
+            if info.kinds[col] == 'categorical':
+                codes = df[col].cat.codes.values
+                counts = np.bincount(codes[codes >= 0], minlength=len(df[col].cat.categories))
+                fill = self._categorical_fill(df[col].cat.categories, counts)
+            else:
+                counts = df[col].value_counts().sort_index()
+                fill = self._categorical_fill(counts.index, counts.values)
+
+            if fill is not None:
+                self.fills[col] = fill
+
+        return self
+
+    def fit_chunks(self, chunks, k=200):
+        """
+        Fits from an iterator of DataFrame chunks, with medians approximated by a QuantileSketch of each numeric
+        column (of size k) and categorical fills from exact value counts.
+        """
+        from jupyter_utils.sketch import QuantileSketch
+
+        sketches, counts = {}, {}
+        for chunk in chunks:
+            info = datatype.schema(chunk)
+            for col in info.columns_of('int', 'float'):
+                sketches.setdefault(col, QuantileSketch(k)).update(datatype.float_values(chunk[col]))
+            for col in info.columns_of('categorical', 'string'):
+                value_counts = chunk[col].value_counts()
+                counts[col] = value_counts if col not in counts else counts[col].add(value_counts, fill_value=0)
+
+        for col, sketch in sketches.items():
+            self.fills[col] = sketch.median() if self._mode == 'median' else 0
+        for col, value_counts in counts.items():
+            value_counts = value_counts.sort_index()
+            fill = self._categorical_fill(value_counts.index, value_counts.values)
+            if fill is not None:
+                self.fills[col] = fill
+
+        return self
+
+    def transform(self, df: pd.DataFrame, create_missing_cols=False, indicators: MissingIndicators=None):
+        """Fills the nulls of df in place, column by column, adding {col}_missing columns if asked."""
+        for col, fill in self.fills.items():
+            if col not in df.columns:
+                continue
+
+            col_is_missing = df[col].isnull()
+            if not col_is_missing.any():
+                continue
+
+            if create_missing_cols:
+                _indicate(df, "{}_missing".format(col), col_is_missing.values, indicators)
+
+            series = df[col]
+            if datatype.is_int(series.dtype):
+                # the median of a (nullable) integer column can fall between two values
+                fill = int(np.round(fill))
+            elif datatype.is_categorical(series.dtype) and fill not in series.cat.categories:
+                series = series.cat.add_categories([fill])
+            df[col] = series.fillna(fill)
+
+        return df
+
+    def save(self, path):
+        """Saves the fills with store.save_arrays, each as a one item array."""
+        from jupyter_utils.store import save_arrays
+        save_arrays(path, {'mode': self._mode, 'categorical': self._categorical, 'columns': list(self.fills)},
+                    [(col, pd.Index([fill])) for col, fill in self.fills.items()])
+
+    @classmethod
+    def load(cls, path):
+        from jupyter_utils.store import load_arrays
+        meta, arrays = load_arrays(path)
+        imputer = cls(mode=meta['mode'], categorical=meta['categorical'])
+        for col, fill in zip(meta['columns'], arrays):
+            imputer.fills[col] = pd.Index(fill)[0]
+
+        return imputer
+
+class OnlineImpute:
+    """
+    Imputes a stream of chunks (e.g. hourly drops) with running estimates: a QuantileSketch of each numeric column for
+    its median, and FrequentItems of each categorical or string column for its mode, so memory per column stays
+    constant however many rows are seen. Imputers updated in parallel workers can be merged.
+
+    >>> imputer = OnlineImpute()
+    >>> for chunk in pd.read_csv(path, chunksize=100000):
+    ...     imputer.update(chunk).transform(chunk)
+    """
+
+    def __init__(self, mode='median', k=200, capacity=1000):
+        if mode not in {'median', 'zerofill'}:
+            raise ValueError("Expecting one of median, zerofill for mode")
+
+        self._mode = mode
+        self._k = k
+        self._capacity = capacity
+        self.sketches = {}
+        self.frequent = {}
+
+    def update(self, chunk: pd.DataFrame):
+        from jupyter_utils.sketch import QuantileSketch, FrequentItems
+
+        info = datatype.schema(chunk)
+        for col in info.columns_of('int', 'float'):
+            self.sketches.setdefault(col, QuantileSketch(self._k)).update(datatype.float_values(chunk[col]))
+        for col in info.columns_of('categorical', 'string'):
+            self.frequent.setdefault(col, FrequentItems(self._capacity)).update(chunk[col])
+
+        return self
+
+    def merge(self, other):
+        for col, sketch in other.sketches.items():
+            if col in self.sketches:
+                self.sketches[col].merge(sketch)
+            else:
+                self.sketches[col] = sketch
+        for col, frequent in other.frequent.items():
+            if col in self.frequent:
+                self.frequent[col].merge(frequent)
+            else:
+                self.frequent[col] = frequent
+
+        return self
+
+    def fills(self):
+        """The current fill value of each column seen so far (and that had any values)."""
+        fills = {}
+        for col, sketch in self.sketches.items():
+            if len(sketch) > 0:
+                fills[col] = sketch.median() if self._mode == 'median' else 0
+        for col, frequent in self.frequent.items():
+            if frequent.most_frequent() is not None:
+                fills[col] = frequent.most_frequent()
+
+        return fills
+
+    def errors(self) -> pd.Series:
+        """
+        The error bound of each column's estimate: the rank error of the median (as a fraction of the rows), and the
+        most a categorical count can be under.
+        """
+        errors = {col: sketch.rank_error for col, sketch in self.sketches.items()}
+        errors.update({col: frequent.error for col, frequent in self.frequent.items()})
+        return pd.Series(errors)
+
+    def transform(self, chunk: pd.DataFrame, create_missing_cols=False, indicators: MissingIndicators=None):
+        """Fills the nulls of the chunk in place with the current estimates."""
+        imputer = FittedImpute(mode=self._mode)
+        imputer.fills = self.fills()
+        return imputer.transform(chunk, create_missing_cols=create_missing_cols, indicators=indicators)
+
+
 class BayesianImpute(Impute):
 
     def __init__(self, df:pd.DataFrame, logger:logging.Logger):
-        super().__init__()
-        self._df = df.copy()
-        self._missing_indices = {}
-        self._logger = logger
+        super().__init__(df.copy(), logger)
         self._autotype = bayesianpy.data.AutoType(self._df)
 
 
@@ -105,39 +467,98 @@ class BayesianImpute(Impute):
             nm.train(dataset)
         return nm
 
-    def fill_missing_cols(self):
+    def fill_missing_cols(self, chunk_size=10000, processes=None):
+        """
+        Queries the trained model for the rows that have any nulls only, chunk_size rows at a time across processes
+        workers (each attached to its own JVM), and fills the nulls with the results. Workers are spawned rather than
+        forked, as the JVM this process has started does not survive a fork.
+        """
+        import multiprocessing as mp
+        import itertools, os, shutil, tempfile, time
+
         bayesianpy.jni.attach()
         model = self._train()
-        self._logger.info("Finished training, querying whole dataset now.")
         disc = self._autotype.get_discrete_variables()
-        cont = self._autotype.get_continuous_variables()
-        with bayesianpy.data.DefaultDataSet(self._df) as dataset:
-            queries = []
-            q = bayesianpy.output.BatchQuery(model.get_network(), dataset, self._logger)
-            for col in self._df.columns:
-                if col in disc:
-                    queries.append(bayesianpy.output.QueryFactory(
-                        bayesianpy.output.QueryMostLikelyState,
-                        target_variable_name=col,
-                        output_dtype=self._df[col].dtype,
-                        suffix=''))
-                else:
-                    queries.append(bayesianpy.output.QueryFactory(
-                        bayesianpy.output.QueryMeanVariance,
-                        target=col,
-                        output_dtype=self._df[col].dtype,
-                        result_mean_suffix=''
-                    ))
-
-            results = q.query(queries, append_to_df=False)
-            self._missing_df = self._df.isnull()
+        self._missing_df = self._df.isnull()
+        rows = np.flatnonzero(self._missing_df.values.any(axis=1))
+        self._logger.info("Finished training, querying {} of {} rows with missing values now."
+                          .format(len(rows), len(self._df)))
 
         for col in self._df.columns:
             indices = np.where(self._df[col].isna())
             self._missing_indices.update({col: indices})
 
-        self._df[self._df.isnull()] = results
+        if processes is None:
+            processes = max(mp.cpu_count() - 1, 1)
+
+        dtypes = self._df.dtypes.to_dict()
+        tasks = ((rows[start:start + chunk_size], self._df.iloc[rows[start:start + chunk_size]])
+                 for start in range(0, len(rows), chunk_size))
+
+        started = time.time()
+        done = 0
+
+        def scatter(results):
+            nonlocal done
+            for positions, chunk in results:
+                for i, col in enumerate(self._df.columns):
+                    col_is_missing = self._missing_df[col].values[positions]
+                    if col_is_missing.any():
+                        self._df.iloc[positions[col_is_missing], i] = chunk[col].values[col_is_missing]
+
+                done += len(positions)
+                elapsed = time.time() - started
+                self._logger.info("Queried {} of {} rows ({:.0f} rows/s)".format(done, len(rows),
+                                                                                 done / max(elapsed, 1e-9)))
+
+        if processes > 1 and len(rows) > chunk_size:
+            network_dir = tempfile.mkdtemp()
+            try:
+                network_path = os.path.join(network_dir, 'network.bayes')
+                bayesianpy.network.save(model.get_network(), network_path)
+                with mp.get_context('spawn').Pool(processes, initializer=_attach_network,
+                                                  initargs=(network_path, disc, dtypes)) as pool:
+                    # a few chunks per worker at a time, so only those are held in memory
+                    for batch in iter(lambda: list(itertools.islice(tasks, processes * 2)), []):
+                        scatter(pool.imap(_query_chunk, batch))
+            finally:
+                shutil.rmtree(network_dir, ignore_errors=True)
+        else:
+            _network.update({'network': model.get_network(), 'discrete': disc, 'dtypes': dtypes})
+            scatter(map(_query_chunk, tasks))
 
         return self._df
 
 
+_network = {}
+
+
+def _attach_network(path, discrete, dtypes):
+    bayesianpy.jni.attach()
+    _network.update({'network': bayesianpy.network.load(path), 'discrete': discrete, 'dtypes': dtypes})
+
+
+def _query_chunk(tpl):
+    positions, chunk = tpl
+    logger = logging.getLogger(__name__)
+    queries = []
+    for col in chunk.columns:
+        if col in _network['discrete']:
+            queries.append(bayesianpy.output.QueryFactory(
+                bayesianpy.output.QueryMostLikelyState,
+                target_variable_name=col,
+                output_dtype=_network['dtypes'][col],
+                suffix=''))
+        else:
+            queries.append(bayesianpy.output.QueryFactory(
+                bayesianpy.output.QueryMeanVariance,
+                target=col,
+                output_dtype=_network['dtypes'][col],
+                result_mean_suffix=''
+            ))
+
+    with bayesianpy.data.DefaultDataSet(chunk) as dataset:
+        q = bayesianpy.output.BatchQuery(_network['network'], dataset, logger)
+        results = q.query(queries, append_to_df=False)
+
+    return positions, results
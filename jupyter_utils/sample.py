@@ -1,10 +1,165 @@
+import numpy as np
+import pandas as pd
 
-def random_split(df, train_size=0.5, valid_size=0.3):
-    n = len(df)*train_size
-    n_valid = len(df)*valid_size
-    df_copy = df.copy()
-    train = df_copy.sample(n=int(n), random_state=200)
-    df_copy = df_copy.drop(train.index)
-    valid = df_copy.sample(n=int(n_valid))
-    test = df_copy.drop(valid.index)
-    return train, valid, test
+
+def _random(random_state):
+    # numpy's global state when no seed is given, so np.random.seed(...) reproduces the draws
+    return np.random if random_state is None else np.random.RandomState(random_state)
+
+
+def _assign(rank, size, train_size, valid_size):
+    # 0, 1 or 2 (train, valid, test) from a position in a random order of size items
+    n_train = np.floor(size * train_size)
+    return (rank >= n_train).astype(np.int8) + (rank >= n_train + np.floor(size * valid_size))
+
+
+def split_positions(n, train_size=0.5, valid_size=0.3, random_state=200, stratify=None, groups=None):
+    """
+    The row positions of a train, valid and test split of n rows, from one seeded permutation, each in ascending
+    order. With stratify (labels for every row) each label is split in the same proportions; with groups (a group for
+    every row) all of the rows of a group fall in the same split, with the proportions taken over rows.
+    """
+    if stratify is not None and groups is not None:
+        raise ValueError("Splits can be stratified or grouped, not both")
+
+    permutation = np.random.RandomState(random_state).permutation(n)
+    if stratify is not None:
+        codes, uniques = pd.factorize(np.asarray(stratify)[permutation])
+        # stable sort by label keeps the random order within each label, so rank is a random draw per label
+        order = np.argsort(codes, kind='mergesort')
+        counts = np.bincount(codes + 1, minlength=len(uniques) + 1)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        rank = np.arange(n) - starts[codes[order] + 1]
+        permutation = permutation[order]
+        split = _assign(rank, counts[codes[order] + 1], train_size, valid_size)
+    elif groups is not None:
+        codes, uniques = pd.factorize(np.asarray(groups))
+        sizes = np.bincount(codes + 1, minlength=len(uniques) + 1)
+        group_order = np.random.RandomState(random_state).permutation(len(sizes))
+        # a group goes to the split its first row would land in, by rows preceding it in the shuffled groups
+        preceding = np.empty(len(sizes), dtype=np.int64)
+        preceding[group_order] = np.cumsum(sizes[group_order]) - sizes[group_order]
+        split = _assign(preceding[codes + 1][permutation], n, train_size, valid_size)
+    else:
+        split = _assign(np.arange(n), n, train_size, valid_size)
+
+    return tuple(np.sort(permutation[split == i]) for i in range(3))
+
+
+def random_split(df, train_size=0.5, valid_size=0.3, random_state=200, stratify=None, groups=None):
+    """
+    Splits df into train, valid and test frames of about train_size, valid_size and the remainder of its rows, taken
+    by position with iloc rather than by copying and dropping. stratify and groups can be column names, see
+    split_positions.
+    """
+    if isinstance(stratify, str):
+        stratify = df[stratify].values
+    if isinstance(groups, str):
+        groups = df[groups].values
+
+    return tuple(df.iloc[positions] for positions in
+                 split_positions(len(df), train_size, valid_size, random_state, stratify=stratify, groups=groups))
+
+
+def _read_chunks(path, chunksize, **kwargs):
+    if str(path).endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, **kwargs):
+            yield batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(path, chunksize=chunksize, **kwargs):
+            yield chunk
+
+
+def split_source(path, split='train', train_size=0.5, valid_size=0.3, random_state=200, chunksize=100000, **kwargs):
+    """
+    Yields the chunks of a csv or parquet file that fall in one split, without loading the file. The file is split in
+    ranges of chunksize rows, each range going to a split at random (so about train_size of them to train), and the
+    same random_state gives the same ranges to the same split on every read. kwargs go to read_csv or iter_batches.
+    """
+    index = ['train', 'valid', 'test'].index(split)
+    random = np.random.RandomState(random_state)
+    for chunk in _read_chunks(path, chunksize, **kwargs):
+        draw = random.random_sample()
+        if (draw >= train_size) + (draw >= train_size + valid_size) == index:
+            yield chunk
+
+
+def floyd(N, n, random_state=None):
+    """
+    n distinct positions drawn uniformly from range(N), in ascending order, by Floyd's algorithm: O(n) time and memory
+    however large N is, rather than a permutation of all N.
+    """
+    if n > N:
+        raise ValueError("Can't sample {} of {} rows without replacement".format(n, N))
+
+    stops = np.arange(N - n + 1, N + 1)
+    draws = (_random(random_state).random_sample(n) * stops).astype(np.int64)
+    chosen = set()
+    for draw, stop in zip(draws.tolist(), stops.tolist()):
+        # stop - 1 is new at this step, so it can stand in for a repeated draw
+        chosen.add(stop - 1 if draw in chosen else draw)
+
+    return np.sort(np.fromiter(chosen, dtype=np.int64, count=n))
+
+
+def _keep_smallest(keys, n, labels=None):
+    # positions of the n smallest keys, or of the n smallest of each label
+    if labels is None:
+        if len(keys) <= n:
+            return np.arange(len(keys))
+        return np.argpartition(keys, n - 1)[:n]
+
+    codes, _ = pd.factorize(labels)
+    order = np.lexsort((keys, codes))
+    starts = np.flatnonzero(np.r_[True, codes[order][1:] != codes[order][:-1]])
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    return order[rank < n]
+
+
+def reservoir(chunks, n, weights=None, stratify=None, random_state=None):
+    """
+    A random sample of n rows (n of each value of the stratify column, if given) from an iterable of frames such as
+    pd.read_csv(..., chunksize=...), pd.read_sql(..., chunksize=...) or cursor_chunks, keeping no more than the
+    sample and one chunk in memory. With a weights column rows are drawn with probability proportional to their
+    weight (Efraimidis & Spirakis), without replacement. The rows keep their order and index. Without a random_state
+    the draws come from numpy's global random state.
+    """
+    random = _random(random_state)
+    kept, kept_keys, kept_order = None, np.empty(0), np.empty(0, dtype=np.int64)
+    seen = 0
+    for chunk in chunks:
+        draws = random.random_sample(len(chunk))
+        # the smallest n of -log(u) / w are a weighted sample, and of u alone an unweighted one
+        keys = draws if weights is None else -np.log(draws) / chunk[weights].values
+        candidates = chunk if kept is None else pd.concat([kept, chunk])
+        keys = np.concatenate([kept_keys, keys])
+        order = np.concatenate([kept_order, np.arange(seen, seen + len(chunk))])
+        keep = _keep_smallest(keys, n, None if stratify is None else candidates[stratify].values)
+        keep = keep[np.argsort(order[keep], kind='mergesort')]
+        kept, kept_keys, kept_order = candidates.iloc[keep], keys[keep], order[keep]
+        seen += len(chunk)
+
+    return kept
+
+
+def cursor_chunks(cursor, size=10000):
+    """The rows of an executed DB-API cursor as frames of up to size rows, named from cursor.description."""
+    columns = [column[0] for column in cursor.description]
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        yield pd.DataFrame.from_records(rows, columns=columns)
+
+
+def get_sample(df, n, weights=None, stratify=None, random_state=None):
+    """
+    A random sample of n rows of df without replacement, in their original order. Positions are drawn with floyd,
+    or with reservoir when the sample is weighted or stratified. Without a random_state the draws come from numpy's
+    global random state, so np.random.seed(...) reproduces them.
+    """
+    if weights is not None or stratify is not None:
+        return reservoir([df], n, weights=weights, stratify=stratify, random_state=random_state)
+
+    return df.iloc[floyd(len(df), min(n, len(df)), random_state)]
@@ -1,4 +1,6 @@
 import math
+import numpy as np
+import pandas as pd
 import sklearn.metrics
 
 def rmse(x,y): return math.sqrt(((x-y)**2).mean())
@@ -10,7 +12,8 @@ def show(m, X_train, y_train, X_valid, y_valid):
     print(res)
 
 
-def binary_errors(df, y_pred, y_valid):
+def binary_errors(df, y_pred, y_valid, inplace=True):
+    if not inplace: df = df.copy()
     df['actual'] = y_valid
     df['errors'] = 'tp'
     df['predicted'] = y_pred
@@ -21,9 +24,19 @@ def binary_errors(df, y_pred, y_valid):
 
 
 def accuracy(m, X_valid, y_valid, callback=None):
-    res = sklearn.metrics.confusion_matrix(y_valid, m.predict(X_valid), labels=None,
-                                                      sample_weight=None).ravel()
-    result = {'tn':res[0], 'fp':res[1], 'fn': res[2], 'tp': res[3], 'accuracy': 1-((res[1] + res[2]) / (res[0]+res[3])) }
+    """
+    tn, fp, fn, tp and accuracy of m's predictions, and the callback applied to (tn, fp, fn, tp) if given. With more
+    than two classes each of these is an array of the counts of each class against the rest, as one_vs_rest gives them.
+    """
+    y_pred = m.predict(X_valid)
+    confusion = sklearn.metrics.confusion_matrix(y_valid, y_pred, labels=None, sample_weight=None)
+    if confusion.shape == (2, 2):
+        res = confusion.ravel()
+    else:
+        counts = one_vs_rest(y_valid, y_pred)
+        res = [counts['tn'], counts['fp'], counts['fn'], counts['tp']]
+
+    result = {'tn':res[0], 'fp':res[1], 'fn': res[2], 'tp': res[3], 'accuracy': _accuracy(*res) }
     if hasattr(m, 'oob_score_'):
         result.update({'oob_score': m.oob_score_})
 
@@ -45,17 +58,101 @@ def roc(m, X_valid, y_valid):
     return fpr, tpr, roc_auc, threshold
 
 def cutoff_youdens_j(fpr, tpr, thresholds):
-    import numpy as np
     '''Optimal cutoff for roc curve'''
-
+    fpr, tpr, thresholds = np.asarray(fpr), np.asarray(tpr), np.asarray(thresholds)
     j_scores = tpr-fpr
-    j_ordered = sorted(zip(j_scores,thresholds))
-    v1 =  j_ordered[-1][1]
+    # the highest threshold among those with the best J
+    best = np.flatnonzero(j_scores == j_scores.max())
+    v1 = thresholds[best[np.argmax(thresholds[best])]]
 
     optimal_idx = np.argmin(np.abs(tpr - fpr))
     optimal_threshold = thresholds[optimal_idx]
     return v1, optimal_threshold
 
+
+def _positive_scores(y_score):
+    y_score = np.asarray(y_score, dtype=np.float64)
+    return y_score[:, 1] if y_score.ndim == 2 else y_score
+
+
+def confusion_curve(y_true, y_score):
+    """
+    tn, fp, fn and tp for every distinct threshold of y_score (predicting positive where the score is at least the
+    threshold), from a single sort. Returns them as arrays along with the thresholds, which descend. y_score can be
+    the output of predict_proba.
+    """
+    y_score = _positive_scores(y_score)
+    order = np.argsort(y_score, kind='mergesort')[::-1]
+    y_score = y_score[order]
+    y_true = np.asarray(y_true)[order] > 0
+    # the last row of each run of tied scores
+    distinct = np.r_[np.flatnonzero(np.diff(y_score)), len(y_score) - 1]
+    tp = np.cumsum(y_true)[distinct]
+    fp = distinct + 1 - tp
+    positives = y_true.sum()
+    return len(y_true) - positives - fp, fp, positives - tp, tp, y_score[distinct]
+
+
+def threshold_metrics(y_true, y_score, metrics=None):
+    """
+    The confusion counts and ratio metrics (accuracy, recall, precision, true and false positive rates, positive
+    likelihood ratio and informedness by default, or the given dict of name to callback) at every threshold, as a
+    dict of arrays keyed by name. Undefined ratios are NaN or inf.
+    """
+    if metrics is None:
+        metrics = {'accuracy': _accuracy, 'recall': recall, 'precision': precision,
+                   'true_positive_rate': true_positive_rate, 'false_positive_rate': false_positive_rate,
+                   'positive_likelihood_ratio': positive_likelihood_ratio, 'informedness': informedness}
+
+    tn, fp, fn, tp, thresholds = confusion_curve(y_true, y_score)
+    result = {'threshold': thresholds, 'tn': tn, 'fp': fp, 'fn': fn, 'tp': tp}
+    tn, fp, fn, tp = (counts.astype(np.float64) for counts in (tn, fp, fn, tp))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result.update({name: callback(tn, fp, fn, tp) for name, callback in metrics.items()})
+
+    return result
+
+
+def _label_codes(labels, values):
+    labels, values = pd.Index(labels), np.asarray(values)
+    if values.dtype == bool and labels.dtype.kind in 'iuf':
+        # predictions such as y_score > 0.5 against labels of 0 and 1
+        values = values.astype(np.int64)
+
+    codes = labels.get_indexer(values)
+    if (codes < 0).any():
+        raise ValueError("Expecting labels in {}, got {}".format(list(labels), sorted(set(values[codes < 0].tolist()))))
+
+    return codes
+
+
+def one_vs_rest(y_true, y_pred, labels=None):
+    """
+    tn, fp, fn and tp of each class against the rest, from one bincount of the (actual, predicted) pairs. y_pred can
+    be labels or the output of predict_proba, whose columns are the labels (the model's classes_, or 0 to n - 1 by
+    default). Returns a dict of arrays, with the labels under 'label'.
+    """
+    y_pred = np.asarray(y_pred)
+    if labels is None:
+        labels = np.arange(y_pred.shape[1]) if y_pred.ndim == 2 else np.union1d(y_true, y_pred)
+    labels = np.asarray(labels)
+    if y_pred.ndim == 2:
+        if y_pred.shape[1] != len(labels):
+            raise ValueError("Expecting a column of y_pred for each of {} labels".format(len(labels)))
+        y_pred = labels[np.argmax(y_pred, axis=1)]
+
+    k = len(labels)
+    confusion = np.bincount(_label_codes(labels, y_true) * k + _label_codes(labels, y_pred),
+                            minlength=k * k).reshape(k, k)
+    tp = np.diag(confusion)
+    fp = confusion.sum(axis=0) - tp
+    fn = confusion.sum(axis=1) - tp
+    return {'label': labels, 'tn': confusion.sum() - tp - fp - fn, 'fp': fp, 'fn': fn, 'tp': tp}
+
+
+def _accuracy(tn, fp, fn, tp):
+    return (tn + tp) / (tn + fp + fn + tp)
+
 def recall(tn,fp,fn,tp):
     return true_positive_rate(tn, fp, fn, tp)
 
@@ -66,7 +163,7 @@ def true_positive_rate(tn, fp, fn, tp):
     return tp/(fn+tp)
 
 def false_positive_rate(tn, fp, fn, tp):
-    return fp/(fp+fn)
+    return fp/(fp+tn)
 
 def positive_likelihood_ratio(tn, fp, fn, tp):
     return true_positive_rate(tn, fp, fn, tp) / false_positive_rate(tn, fp, fn, tp)
@@ -74,4 +171,120 @@ def positive_likelihood_ratio(tn, fp, fn, tp):
 def informedness(tn, fp, fn, tp):
     # TPR-FPR, the magnitude of which gives the probability of an informed decision between the two classes
     # (>0 represents appropriate use of information, 0 represents chance-level performance, <0 represents perverse use of information)
-    return true_positive_rate(tn, fp, fn, tp) - false_positive_rate(tn, fp, fn, tp)
\ No newline at end of file
+    return true_positive_rate(tn, fp, fn, tp) - false_positive_rate(tn, fp, fn, tp)
+
+
+class ConfusionCounts:
+    """
+    Binary confusion counts accumulated over chunks of predictions, for validation sets too big to predict at once.
+    labels are the negative and positive class. Counts of separate chunks (e.g. from worker processes) can be merged,
+    and result gives what accuracy returns. See one_vs_rest for more than two classes.
+    """
+
+    def __init__(self, labels=(0, 1)):
+        if len(labels) != 2:
+            raise ValueError("Expecting a negative and a positive label, got {}".format(list(labels)))
+
+        self.labels = np.asarray(labels)
+        self.counts = np.zeros((2, 2), dtype=np.int64)
+
+    def update(self, y_true, y_pred):
+        actual, predicted = _label_codes(self.labels, y_true), _label_codes(self.labels, y_pred)
+        self.counts += np.bincount(actual * 2 + predicted, minlength=4).reshape(2, 2)
+        return self
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+    def result(self, callback=None):
+        """The dict of accuracy, and the callback applied to (tn, fp, fn, tp) if given."""
+        res = self.counts.ravel()
+        result = {'tn': res[0], 'fp': res[1], 'fn': res[2], 'tp': res[3], 'accuracy': _accuracy(*res)}
+        return result, None if callback is None else callback(*res)
+
+
+class RocHistogram:
+    """
+    A ROC curve accumulated over chunks of predicted probabilities by counting positives and negatives in bins of
+    score, so thresholds are the bin edges. Histograms of separate chunks can be merged. The AUC is within auc_error
+    of the exact one, which only differs by pairs of positives and negatives whose scores share a bin.
+    """
+
+    def __init__(self, bins=1000, low=0., high=1.):
+        self.edges = np.linspace(low, high, bins + 1)
+        self.positives = np.zeros(bins, dtype=np.int64)
+        self.negatives = np.zeros(bins, dtype=np.int64)
+
+    def update(self, y_true, y_score):
+        bins = np.clip(np.searchsorted(self.edges, _positive_scores(y_score), side='right') - 1, 0, len(self.positives) - 1)
+        positive = np.asarray(y_true) > 0
+        self.positives += np.bincount(bins[positive], minlength=len(self.positives))
+        self.negatives += np.bincount(bins[~positive], minlength=len(self.negatives))
+        return self
+
+    def merge(self, other):
+        self.positives += other.positives
+        self.negatives += other.negatives
+        return self
+
+    @property
+    def auc_error(self):
+        return 0.5 * np.sum(self.positives * self.negatives.astype(np.float64)) / \
+            (self.positives.sum() * float(self.negatives.sum()))
+
+    def result(self):
+        """fpr, tpr, roc_auc and thresholds, as roc returns them."""
+        tpr = np.r_[0, np.cumsum(self.positives[::-1])] / float(self.positives.sum())
+        fpr = np.r_[0, np.cumsum(self.negatives[::-1])] / float(self.negatives.sum())
+        return fpr, tpr, sklearn.metrics.auc(fpr, tpr), np.r_[np.inf, self.edges[-2::-1]]
+
+
+class SquaredErrors:
+    """Sums of squared errors over chunks, mergeable, giving the rmse of everything seen (NaN before anything is)."""
+
+    def __init__(self):
+        self.total = 0.
+        self.n = 0
+
+    def update(self, x, y):
+        errors = np.asarray(x, dtype=np.float64) - np.asarray(y, dtype=np.float64)
+        self.total += float(np.dot(errors, errors))
+        self.n += len(errors)
+        return self
+
+    def merge(self, other):
+        self.total += other.total
+        self.n += other.n
+        return self
+
+    def result(self):
+        if self.n == 0:
+            return np.nan
+
+        return math.sqrt(self.total / self.n)
+
+
+def accuracy_chunks(m, chunks, callback=None):
+    """
+    accuracy over an iterable of (X_valid, y_valid) chunks, without holding them all. m's classes_ (when it has them)
+    are the negative and positive labels.
+    """
+    counts = ConfusionCounts(labels=getattr(m, 'classes_', (0, 1)))
+    for X_valid, y_valid in chunks:
+        counts.update(y_valid, m.predict(X_valid))
+
+    result, x = counts.result(callback)
+    if hasattr(m, 'oob_score_'):
+        result.update({'oob_score': m.oob_score_})
+
+    return result, x
+
+
+def roc_chunks(m, chunks, bins=1000):
+    """roc over an iterable of (X_valid, y_valid) chunks, with thresholds binned as in RocHistogram."""
+    histogram = RocHistogram(bins)
+    for X_valid, y_valid in chunks:
+        histogram.update(y_valid, m.predict_proba(X_valid))
+
+    return histogram.result()
@@ -21,7 +21,11 @@ def all_rows(df):
         yield df
 
 
-def missing(df):
+def missing(df, profile=None):
+    # profile: a missing.MissingProfile of df, to save scanning it again
+    if profile is not None:
+        return profile.ratios.sort_index()
+
     return df.isnull().sum().sort_index() / len(df)
 
 
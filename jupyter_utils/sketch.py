@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+
+
+class QuantileSketch:
+    """
+    A KLL quantile sketch: approximate quantiles of a stream of values in memory of roughly 3k items however long the
+    stream is, with a rank error of about rank_error (as a fraction of the count) at any quantile. Sketches of
+    separate parts of a stream can be merged.
+    Paper: Karnin, Lang & Liberty, Optimal Quantile Approximation in Streams (2016), https://arxiv.org/abs/1603.05346
+    """
+
+    def __init__(self, k=200, random_state=None):
+        self.k = k
+        self.n = 0
+        self._compactors = [np.empty(0)]
+        self._random = np.random.RandomState(random_state)
+
+    def _capacity(self, level):
+        depth = len(self._compactors) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self._compactors):
+            items = self._compactors[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self._compactors):
+                    self._compactors.append(np.empty(0))
+
+                items = np.sort(items)
+                # an odd item out stays behind, and a random half of the rest is promoted with double the weight
+                leftover, items = items[:len(items) % 2], items[len(items) % 2:]
+                self._compactors[level] = leftover
+                self._compactors[level + 1] = np.concatenate([self._compactors[level + 1],
+                                                              items[self._random.randint(2)::2]])
+            level += 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self._compactors[0] = np.concatenate([self._compactors[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        for level, items in enumerate(other._compactors):
+            if level == len(self._compactors):
+                self._compactors.append(np.empty(0))
+            self._compactors[level] = np.concatenate([self._compactors[level], items])
+
+        self.n += other.n
+        self._compress()
+        return self
+
+    @property
+    def rank_error(self):
+        return 1.65 / self.k
+
+    def quantile(self, q):
+        """The approximate q quantile(s), NaN when nothing has been seen."""
+        items = np.concatenate(self._compactors)
+        if len(items) == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+
+        weights = np.concatenate([np.full(len(items), 2. ** level) for level, items in enumerate(self._compactors)])
+        order = np.argsort(items, kind='mergesort')
+        items, ranks = items[order], np.cumsum(weights[order])
+        index = np.searchsorted(ranks, np.asarray(q) * ranks[-1], side='left')
+        return items[np.minimum(index, len(items) - 1)]
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def __len__(self):
+        return self.n
+
+
+class FrequentItems:
+    """
+    A Misra-Gries summary: counts of at most capacity distinct values of a stream, with each count low by at most
+    error (n / (capacity + 1)), so every value more frequent than that is kept. Summaries can be merged.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.n = 0
+        self.counts = pd.Series(dtype=np.int64)
+
+    def _add(self, counts):
+        counts = self.counts.add(counts, fill_value=0)
+        if len(counts) > self.capacity:
+            # decrement every count by the (capacity + 1)th largest, dropping those that reach 0
+            counts = counts - counts.nlargest(self.capacity + 1).iloc[-1]
+            counts = counts[counts > 0]
+
+        self.counts = counts.astype(np.int64)
+
+    def update(self, values):
+        values = pd.Series(values)
+        self.n += int(values.notnull().sum())
+        counts = values.value_counts()
+        counts = counts[counts > 0]
+        counts.index = counts.index.astype(object)
+        self._add(counts)
+        return self
+
+    def merge(self, other):
+        self.n += other.n
+        self._add(other.counts)
+        return self
+
+    @property
+    def error(self):
+        return self.n / (self.capacity + 1)
+
+    def most_frequent(self):
+        """The value with the highest count, or None when nothing has been seen."""
+        if len(self.counts) == 0:
+            return None
+
+        return self.counts.idxmax()
+
+    def __len__(self):
+        return self.n
+
+
+def _bit_length(values):
+    # the number of bits needed for each of an array of uint64s
+    values = values.copy()
+    length = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = values >= (np.uint64(1) << np.uint64(shift))
+        length[big] += shift
+        values[big] >>= np.uint64(shift)
+
+    return length + (values > 0)
+
+
+class HyperLogLog:
+    """
+    Approximate count of distinct values of a stream in 2 ** p bytes, with a relative standard error of
+    error (1.04 / sqrt(2 ** p)). Missing values count as one value, as with len(series.unique()). Sketches can be
+    merged.
+    Paper: Flajolet et al., HyperLogLog: the analysis of a near-optimal cardinality estimation algorithm (2007)
+    """
+
+    def __init__(self, p=14):
+        self.p = p
+        self.registers = np.zeros(2 ** p, dtype=np.uint8)
+
+    def update(self, values):
+        hashes = pd.util.hash_pandas_object(pd.Series(values), index=False).values.astype(np.uint64)
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.intp)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # the position of the leftmost 1 bit in the remaining 64 - p bits
+        rank = (64 - self.p) - _bit_length(rest) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+        return self
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    @property
+    def error(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2. ** -self.registers.astype(np.float64))
+        zeros = np.sum(self.registers == 0)
+        if estimate <= 2.5 * m and zeros > 0:
+            # linear counting is the better estimate for small counts
+            estimate = m * np.log(m / zeros)
+
+        return int(round(estimate))
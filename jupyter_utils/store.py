@@ -0,0 +1,162 @@
+import os
+import shutil
+import tempfile
+import multiprocessing as mp
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_string_dtype
+
+from jupyter_utils.datatype import float_values, is_categorical
+
+_ALIGNMENT = 64
+_attached = None
+_state = None
+
+
+class ColumnStore:
+    """
+    Writes the columns of a frame once into a memory mapped file, so that pool workers can read them by name rather
+    than having each Series pickled to them. Numeric columns are stored as their raw values, categorical and string
+    columns as integer codes (-1 for missing) with the levels kept alongside.
+    """
+
+    def __init__(self, df: pd.DataFrame, columns=None):
+        if columns is None:
+            columns = df.columns.tolist()
+
+        self._dir = tempfile.mkdtemp(prefix='jupyter_utils_')
+        self._path = os.path.join(self._dir, 'columns.bin')
+        self._layout = {}
+        self._levels = {}
+        self._length = len(df)
+        self._buffer = None
+
+        try:
+            offset = 0
+            with open(self._path, 'wb') as fh:
+                for col in columns:
+                    values = self._encode(df[col])
+                    padding = -offset % _ALIGNMENT
+                    fh.write(b'\0' * padding)
+                    offset += padding
+                    values.tofile(fh)
+                    self._layout[col] = (offset, values.dtype.str)
+                    offset += values.nbytes
+        except BaseException:
+            self.close()
+            raise
+
+    def _encode(self, series):
+        if is_categorical(series.dtype):
+            self._levels[series.name] = series.cat.categories
+            return np.ascontiguousarray(series.cat.codes.values)
+
+        if is_string_dtype(series.dtype):
+            codes, uniques = pd.factorize(series)
+            self._levels[series.name] = uniques
+            return codes
+
+        if not isinstance(series.values, np.ndarray):
+            # nullable extension columns, stored as float64 with NaN for pd.NA
+            return float_values(series)
+
+        return np.ascontiguousarray(series.values)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_buffer'] = None
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def columns(self):
+        return list(self._layout.keys())
+
+    def __len__(self):
+        return self._length
+
+    def is_encoded(self, name):
+        return name in self._levels
+
+    def levels(self, name):
+        return self._levels[name]
+
+    def values(self, name) -> np.ndarray:
+        """The stored array for a column: the raw values, or the codes of an encoded column."""
+        if self._buffer is None:
+            self._buffer = np.memmap(self._path, dtype=np.uint8, mode='r')
+
+        offset, dtype = self._layout[name]
+        dtype = np.dtype(dtype)
+        return self._buffer[offset:offset + dtype.itemsize * self._length].view(dtype)
+
+    def close(self):
+        self._buffer = None
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+def save_arrays(path, meta, arrays):
+    """
+    Saves a JSON-able meta dict and a list of (name, values) arrays of strings, numbers or timestamps to an npz file,
+    so that load_arrays unpickles nothing. Raises a ValueError for values that are none of those.
+    """
+    import json
+    stored = {}
+    for i, (name, values) in enumerate(arrays):
+        values = np.asarray(values)
+        if values.dtype == object:
+            if not all(isinstance(value, str) for value in values):
+                raise ValueError("Can only save string, numeric or timestamp values, not those of {}".format(name))
+            values = values.astype(str)
+        stored['a{}'.format(i)] = values
+
+    np.savez_compressed(path, meta=np.array(json.dumps(meta)), **stored)
+
+
+def load_arrays(path):
+    """The meta dict and the list of arrays saved by save_arrays."""
+    import json
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        return meta, [data['a{}'.format(i)] for i in range(len(data.files) - 1)]
+
+
+def _attach(store, state=None):
+    global _attached, _state
+    _attached = store
+    _state = state
+
+
+def attached() -> ColumnStore:
+    """The store published to this worker process by shared_pool."""
+    return _attached
+
+
+def attached_state():
+    """The state published to this worker process by shared_pool along with the store."""
+    return _state
+
+
+@contextmanager
+def shared_pool(df: pd.DataFrame, columns=None, processes=None, state=None):
+    """
+    Publishes the columns of df to a ColumnStore, and yields a process pool whose workers can read them through
+    attached(). state, if given, is sent once to each worker along with the store (rather than with every task),
+    and read there through attached_state(). The store is removed once the pool has exited.
+    """
+    if processes is None:
+        processes = max(mp.cpu_count() - 1, 1)
+
+    store = ColumnStore(df, columns)
+    try:
+        with mp.Pool(processes, initializer=_attach, initargs=(store, state)) as pool:
+            yield pool, store
+    finally:
+        store.close()
@@ -0,0 +1,27 @@
+import unittest, os, tempfile
+import pandas as pd
+from jupyter_utils.cache import AssociationCache, fingerprint
+import numpy as np
+
+
+class CacheTest(unittest.TestCase):
+
+    def test_evicts_least_recently_used_values(self):
+        with tempfile.TemporaryDirectory() as td:
+            with AssociationCache(os.path.join(td, 'cache.db'), max_entries=2) as cache:
+                cache.put_many({'a': (0.5, 0.25), 'b': (1., np.nan)})
+                self.assertTrue(np.isnan(cache.get_many(['b'])['b'][1]))
+                self.assertEqual(list(cache.get_many(['a'])), ['a'])
+                cache.put_many({'c': (0., 1.)})
+                self.assertEqual(sorted(cache.get_many(['a', 'b', 'c'])), ['a', 'c'])
+                self.assertEqual(cache.stats(), {'hits': 4, 'misses': 1, 'entries': 2})
+
+            with AssociationCache(os.path.join(td, 'cache.db'), max_entries=2) as cache:
+                # the clock carries on from the file, so a is now more recent than c
+                self.assertEqual(cache.get_many(['a']), {'a': (0.5, 0.25)})
+                cache.put_many({'d': (0., 0.)})
+                self.assertEqual(sorted(cache.get_many(['a', 'c', 'd'])), ['a', 'd'])
+
+    def test_fingerprint_follows_values_not_names(self):
+        self.assertEqual(fingerprint(pd.Series([1, 2], name='a')), fingerprint(pd.Series([1, 2], name='b')))
+        self.assertNotEqual(fingerprint(pd.Series([1, 2])), fingerprint(pd.Series([1., 2.])))
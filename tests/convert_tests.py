@@ -0,0 +1,88 @@
+import unittest, logging
+import pandas as pd
+import jupyter_utils.convert
+import numpy as np
+
+
+class ConvertTest(unittest.TestCase):
+
+    def test_optimize_dtypes_shrinks_columns_without_changing_values(self):
+        df = pd.DataFrame({'A': np.arange(100), 'B': np.arange(100) % 2, 'C': np.arange(100) * 0.5,
+                           'D': np.random.RandomState(0).rand(100), 'E': ['a', 'b'] * 50})
+        expected = df.copy()
+        df, report = jupyter_utils.convert.optimize_dtypes(df)
+        self.assertEqual([str(dtype) for dtype in df.dtypes], ['int8', 'bool', 'float32', 'float64', 'category'])
+        self.assertTrue((report['after_bytes'] <= report['before_bytes']).all())
+        for col in expected.columns:
+            self.assertEqual(df[col].astype(expected[col].dtype).tolist(), expected[col].tolist())
+
+        # past int64, too precise for float32, already narrow, and only fitting an unsigned int
+        df = pd.DataFrame({'A': np.array([2 ** 63 + 5, 1], dtype=np.uint64), 'B': [1e20, 1.],
+                           'C': np.array([0.5, 1.5], dtype=np.float16), 'D': [200, 3]})
+        df, report = jupyter_utils.convert.optimize_dtypes(df)
+        self.assertEqual([str(dtype) for dtype in df.dtypes], ['uint64', 'float64', 'float16', 'uint8'])
+        self.assertEqual(df['A'].tolist(), [2 ** 63 + 5, 1])
+        self.assertEqual(df['B'].tolist(), [1e20, 1.])
+        self.assertTrue((report['after_bytes'] <= report['before_bytes']).all())
+
+    def _mixed_df(self):
+        values = [str(i) for i in range(95)] + ['a', 'b', 'c', None, None]
+        return pd.DataFrame({'A': values, 'B': ['x', '1', '2', 'y'] * 25, 'C': values,
+                             'D': pd.Categorical(['1.5', '2', None, '3'] * 25), 'E': np.arange(100.)})
+
+    def test_coerce_to_numeric_converts_mostly_numeric_columns(self):
+        df = self._mixed_df()
+        self.assertIs(jupyter_utils.convert.coerce_to_numeric(df, logging.getLogger(), cutoff=0.1, ignore=['C'],
+                                                              processes=1, sample_size=50), df)
+        # 3 of the 95 distinct values of A aren't numbers, half of those of B
+        self.assertEqual(df['A'].dtype, np.float64)
+        self.assertEqual(df['A'][:95].tolist(), list(range(95)))
+        self.assertTrue(df['A'][95:].isnull().all())
+        self.assertEqual(df['B'].tolist(), ['x', '1', '2', 'y'] * 25)
+        self.assertEqual(df['C'].tolist(), self._mixed_df()['C'].tolist())
+        np.testing.assert_array_equal(df['D'][:4], [1.5, 2., np.nan, 3.])
+
+    def test_coerce_to_numeric_in_pool_matches_in_process(self):
+        serial = jupyter_utils.convert.coerce_to_numeric(self._mixed_df(), logging.getLogger(), processes=1)
+        pooled = jupyter_utils.convert.coerce_to_numeric(self._mixed_df(), logging.getLogger(), processes=2)
+        self.assertTrue(pooled.equals(serial))
+        self.assertEqual(serial['C'].dtype, np.float64)
+
+    def test_to_categorical_in_chunks_matches_astype(self):
+        random = np.random.RandomState(0)
+        df = pd.DataFrame({'A': random.choice(['x', 'y', 'z', None], 250), 'B': np.arange(250)})
+        expected = df['A'].astype('category').cat.as_ordered()
+        jupyter_utils.convert.to_categorical(df, None, processes=1, chunk_size=60)
+        self.assertTrue(df['A'].equals(expected))
+
+    def test_category_encoder_round_trips_through_file(self):
+        import os, tempfile
+        train = pd.DataFrame({'A': ['x', 'y', 'z', 'x']})
+        batch = pd.DataFrame({'A': ['z', 'unseen', None]})
+        with tempfile.TemporaryDirectory() as td:
+            path = os.path.join(td, 'categories.npz')
+            jupyter_utils.convert.CategoryEncoder().fit(train).save(path)
+            encoder = jupyter_utils.convert.CategoryEncoder.load(path)
+
+        encoder.to_codes(batch)
+        self.assertEqual(batch['A'].tolist(), [3, 0, 0])
+
+        mixed = pd.DataFrame({'A': pd.Categorical([1, 'x'])})
+        with tempfile.TemporaryDirectory() as td:
+            with self.assertRaises(ValueError):
+                jupyter_utils.convert.CategoryEncoder().fit(mixed).save(os.path.join(td, 'categories.npz'))
+
+    def test_sparse_onehot_matches_get_dummies(self):
+        df = pd.DataFrame({'A': [1., 2, 3, 4], 'B': pd.Categorical(['x', 'y', 'x', None])})
+        matrix, names = jupyter_utils.convert.to_onehot(df, sparse=True)
+        expected = pd.get_dummies(df, columns=['B'])
+        self.assertEqual(names, expected.columns.tolist())
+        np.testing.assert_array_equal(matrix.toarray(), expected.values.astype(float))
+
+    def test_sparse_onehot_encodes_string_columns(self):
+        df = pd.DataFrame({'A': [1, 2, 3], 'B': ['y', 'x', None], 'C': pd.array([1., None, 2.], dtype='Float64')})
+        matrix, names = jupyter_utils.convert.to_onehot(df, sparse=True)
+        self.assertEqual(names, ['A', 'C', 'B_x', 'B_y'])
+        np.testing.assert_array_equal(matrix.toarray(), [[1, 1, 0, 1], [2, np.nan, 1, 0], [3, 2, 0, 0]])
+        with self.assertRaises(ValueError):
+            jupyter_utils.convert.to_sparse_onehot(pd.DataFrame({'D': pd.to_datetime(['2019', '2020'])}))
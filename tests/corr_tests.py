@@ -0,0 +1,153 @@
+import unittest, unittest.mock as mock
+import pandas as pd
+import jupyter_utils.corr
+import numpy as np
+
+
+class CorrTest(unittest.TestCase):
+
+    def _categorical_df(self):
+        random = np.random.RandomState(0)
+        df = pd.DataFrame({'A': random.choice(['a', 'b', 'c'], 200), 'B': random.choice(['x', 'y'], 200)})
+        df['C'] = df['A'] + df['B']
+        df.loc[3, 'A'] = np.nan
+        return df.astype('category')
+
+    def test_theils_u_matrix_matches_pairwise_theils_u(self):
+        df = self._categorical_df()
+        matrix = jupyter_utils.corr.categorical(df, as_matrix=True)
+        for x in df.columns:
+            for y in df.columns:
+                self.assertAlmostEqual(matrix.at[x, y], jupyter_utils.corr.theils_u(df[x], df[y]))
+        codes, levels = jupyter_utils.corr.factorize(df['A'])
+        self.assertEqual((codes.dtype, levels), (df['A'].cat.codes.dtype, 4))
+
+    def test_categorical_returns_long_format(self):
+        df = self._categorical_df()
+        result = jupyter_utils.corr.categorical(df)
+        self.assertEqual(result[['x', 'y']].values.tolist(), [['A', 'B'], ['A', 'C'], ['B', 'C']])
+
+    def test_theils_u_matrix_in_pool_matches_serial(self):
+        df = self._categorical_df()
+        serial = jupyter_utils.corr.theils_u_matrix(df)
+        pooled = jupyter_utils.corr.theils_u_matrix(df, processes=2)
+        np.testing.assert_allclose(pooled.values, serial.values)
+
+    def test_associations_of_mixed_columns(self):
+        df = self._categorical_df()
+        random = np.random.RandomState(3)
+        df['X'] = df['A'].cat.codes + random.randn(len(df))
+        df['Y'] = df['X'] + random.randn(len(df))
+        df.loc[5, 'Y'] = np.nan
+        matrix = jupyter_utils.corr.associations(df, as_matrix=True, processes=1)
+        self.assertEqual(matrix.columns.tolist(), ['A', 'B', 'C', 'X', 'Y'])
+        self.assertAlmostEqual(matrix.at['A', 'C'], jupyter_utils.corr.theils_u(df['A'], df['C']))
+        self.assertAlmostEqual(matrix.at['C', 'A'], jupyter_utils.corr.theils_u(df['C'], df['A']))
+        for cat, cont in (('A', 'X'), ('B', 'Y')):
+            present = df[cont].notnull()
+            expected = jupyter_utils.corr.correlation_ratio(df[cat][present], df[cont][present])
+            self.assertAlmostEqual(matrix.at[cat, cont], expected)
+            self.assertAlmostEqual(matrix.at[cont, cat], expected)
+        self.assertAlmostEqual(matrix.at['X', 'Y'], jupyter_utils.corr.pearson_matrix(df)[0].at['X', 'Y'])
+        pooled = jupyter_utils.corr.associations(df, as_matrix=True, processes=2)
+        np.testing.assert_allclose(pooled.values, matrix.values)
+        self.assertEqual(len(jupyter_utils.corr.associations(df)), 10)
+
+    def test_pearson_matrix_matches_pearsonr_on_complete_pairs(self):
+        import scipy.stats as ss
+        random = np.random.RandomState(1)
+        df = pd.DataFrame(random.randn(50, 3), columns=['A', 'B', 'C'])
+        df['B'] += df['A']
+        df.loc[random.rand(50) < 0.2, 'B'] = np.nan
+        r, p = jupyter_utils.corr.pearson_matrix(df)
+        complete = df[['A', 'B']].dropna()
+        expected_r, expected_p = ss.pearsonr(complete['A'], complete['B'])
+        self.assertAlmostEqual(r.at['A', 'B'], expected_r)
+        self.assertAlmostEqual(p.at['A', 'B'], expected_p)
+
+    def test_accumulator_over_chunks_matches_whole_frame(self):
+        df = self._categorical_df().astype(object)
+        first = jupyter_utils.corr.accumulate((df.iloc[i:i + 50] for i in range(0, 100, 50)), columns=['A', 'B'])
+        second = jupyter_utils.corr.accumulate([df.iloc[100:]], columns=['A', 'B'])
+        first.merge(second)
+        self.assertEqual(len(first), len(df))
+        self.assertAlmostEqual(first.theils_u('A', 'B'), jupyter_utils.corr.theils_u(df['A'], df['B']))
+        self.assertAlmostEqual(first.cramers_v('A', 'B'), jupyter_utils.corr.cramers_v(df['A'], df['B']))
+
+    def test_correlation_ratio_matches_grouped_means(self):
+        random = np.random.RandomState(2)
+        categories = pd.Series(random.choice(['a', 'b', 'c'], 100))
+        measurements = categories.map({'a': 0, 'b': 1, 'c': 2}) + random.randn(100)
+        means = measurements.groupby(categories).transform('mean')
+        expected = np.sqrt(((means - measurements.mean()) ** 2).sum() / ((measurements - measurements.mean()) ** 2).sum())
+        self.assertAlmostEqual(jupyter_utils.corr.correlation_ratio(categories, measurements), expected)
+
+    def test_screen_keeps_only_pairs_that_may_reach_threshold(self):
+        df = self._categorical_df()
+        result = jupyter_utils.corr.categorical(df, threshold=0.5, random_state=0)
+        pairs = set(map(tuple, result[['x', 'y']].values.tolist()))
+        self.assertIn(('A', 'C'), pairs)
+        self.assertNotIn(('A', 'B'), pairs)
+        with mock.patch.object(jupyter_utils.corr, 'factorize', wraps=jupyter_utils.corr.factorize) as factorize:
+            jupyter_utils.corr.screen(df, 0.5, max_size=50, random_state=0)
+        self.assertTrue(all(len(call[0][0]) == 50 for call in factorize.call_args_list))
+
+    def test_screen_drops_independent_high_cardinality_pairs(self):
+        random = np.random.RandomState(0)
+        df = pd.DataFrame({'A': random.randint(0, 300, 50000), 'B': random.randint(0, 300, 50000)}).astype('category')
+        df['C'] = (df['A'].astype(int) // 2).astype('category')
+        result = jupyter_utils.corr.screen(df, 0.5, random_state=0)
+        self.assertEqual(result[['x', 'y']].values.tolist(), [['A', 'C']])
+        self.assertEqual(result['sample_size'][0], len(df))
+        self.assertAlmostEqual(result['value'][0], jupyter_utils.corr.theils_u_matrix(df).at['A', 'C'], places=2)
+
+    def test_cached_matrix_only_computes_new_pairs(self):
+        import os, tempfile
+        from jupyter_utils.cache import AssociationCache
+        df = self._categorical_df()
+        with tempfile.TemporaryDirectory() as td, AssociationCache(os.path.join(td, 'cache.db')) as cache:
+            first = jupyter_utils.corr.categorical(df[['A', 'B']], cache=cache)
+            second = jupyter_utils.corr.categorical(df, cache=cache)
+            self.assertEqual(cache.stats(), {'hits': 1, 'misses': 3, 'entries': 3})
+            self.assertAlmostEqual(first['value'][0], second['value'][0])
+            np.testing.assert_allclose(jupyter_utils.corr.categorical(df, cache=cache, as_matrix=True).values,
+                                       jupyter_utils.corr.theils_u_matrix(df).values)
+
+            random = np.random.RandomState(1)
+            floats = pd.DataFrame(random.randn(50, 3), columns=['A', 'B', 'C'])
+            floats.loc[:45, 'C'] = np.nan
+            cached = jupyter_utils.corr.cached_matrix(floats, cache, method='pearson')
+            cached = jupyter_utils.corr.cached_matrix(floats, cache, method='pearson')
+            for matrix, expected in zip(cached, jupyter_utils.corr.pearson_matrix(floats)):
+                np.testing.assert_allclose(matrix.values, expected.values)
+
+    def test_search_top_k_matches_full_matrix(self):
+        df = self._categorical_df()
+        matrix = jupyter_utils.corr.theils_u_matrix(df)
+        for record in jupyter_utils.corr.search(df, k=1):
+            others = matrix.loc[record['x']].drop(record['x'])
+            self.assertAlmostEqual(record['value'], others.max())
+        with self.assertRaises(ValueError):
+            jupyter_utils.corr.search(df, k=0)
+        pooled = sorted(jupyter_utils.corr.search(df, threshold=0.1, processes=2), key=lambda r: (r['x'], r['y']))
+        serial = sorted(jupyter_utils.corr.search(df, threshold=0.1), key=lambda r: (r['x'], r['y']))
+        self.assertEqual([(r['x'], r['y']) for r in pooled], [(r['x'], r['y']) for r in serial])
+        np.testing.assert_allclose([r['value'] for r in pooled], [r['value'] for r in serial])
+
+    def test_pearson_matrix_reads_nullable_float_columns(self):
+        from jupyter_utils.store import ColumnStore
+        df = pd.DataFrame({'A': pd.array([1., 2., None, 4.], dtype='Float64'), 'B': [2., 4.5, 5., 8.]})
+        r, p = jupyter_utils.corr.pearson_matrix(df)
+        expected = df.astype(float).corr()
+        self.assertAlmostEqual(r.at['A', 'B'], expected.at['A', 'B'])
+        with ColumnStore(df) as store:
+            self.assertTrue(np.isnan(store.values('A')[2]))
+
+    def test_column_store_removes_its_file_when_a_column_fails(self):
+        import glob, tempfile
+        from jupyter_utils.store import shared_pool
+        before = set(glob.glob(tempfile.gettempdir() + '/jupyter_utils_*'))
+        with self.assertRaises(TypeError):
+            with shared_pool(pd.DataFrame({'A': [[1], [2]]}), processes=1):
+                pass
+        self.assertEqual(set(glob.glob(tempfile.gettempdir() + '/jupyter_utils_*')), before)
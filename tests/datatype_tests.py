@@ -0,0 +1,34 @@
+import unittest
+import pandas as pd
+import jupyter_utils.datatype
+import numpy as np
+
+
+class DatatypeTest(unittest.TestCase):
+
+    def test_schema_classifies_narrow_and_nullable_dtypes(self):
+        df = pd.DataFrame({'A': np.array([1, 2], dtype='int8'), 'B': np.array([1, 2], dtype='uint16'),
+                           'C': np.array([1, 2], dtype='float16'), 'D': pd.to_datetime(['2019', '2020']).tz_localize('UTC'),
+                           'E': ['x', 'y'], 'F': pd.Categorical(['x', 'y']), 'G': [True, False],
+                           'H': np.array([1 + 1j, 2], dtype='complex128'), 'I': pd.period_range('2019', periods=2)})
+        schema = jupyter_utils.datatype.schema(df)
+        self.assertEqual(schema.kinds, {'A': 'int', 'B': 'int', 'C': 'float', 'D': 'timestamp', 'E': 'string',
+                                        'F': 'categorical', 'G': 'bool', 'H': 'other', 'I': 'other'})
+        self.assertEqual(jupyter_utils.datatype.classify(np.complex128), 'other')
+        self.assertTrue(schema.could_be_int('C'))
+        self.assertIs(jupyter_utils.datatype.schema(df), schema)
+
+    def test_schema_is_rebuilt_when_dtypes_change(self):
+        df = pd.DataFrame({'A': [1.5, np.nan]})
+        schema = jupyter_utils.datatype.schema(df)
+        df['B'] = ['x', 'y']
+        self.assertIsNot(jupyter_utils.datatype.schema(df), schema)
+        self.assertFalse(jupyter_utils.datatype.schema(df).could_be_int('A'))
+
+    def test_integrality_follows_values_changed_in_place(self):
+        import jupyter_utils.convert
+        df = pd.DataFrame({'A': [1., 2., 3.]})
+        self.assertTrue(jupyter_utils.datatype.schema(df).could_be_int('A'))
+        df['A'] = [1.5, 2.5, 3.5]
+        df, _ = jupyter_utils.convert.optimize_dtypes(df)
+        self.assertEqual(df['A'].tolist(), [1.5, 2.5, 3.5])
@@ -0,0 +1,29 @@
+import unittest
+import pandas as pd
+import jupyter_utils.everything
+
+
+class EverythingTest(unittest.TestCase):
+
+    def test_add_datepart_expands_the_column_in_place(self):
+        df = pd.DataFrame({'B': [1, 2, 3], 'ADate': pd.to_datetime(['2000-03-11', '2000-03-12', '2000-12-31'])})
+        frame = df
+        self.assertIsNone(jupyter_utils.everything.add_datepart(df, 'ADate'))
+        self.assertIs(df, frame)
+        self.assertNotIn('ADate', df.columns)
+        self.assertEqual(df.columns[:2].tolist(), ['B', 'AYear'])
+        self.assertEqual(df['ADay'].tolist(), [11, 12, 31])
+        self.assertEqual(df['ADayofweek'].tolist(), [5, 6, 6])
+        self.assertEqual(df['AIs_year_end'].tolist(), [False, False, True])
+        self.assertEqual(df['AElapsed'][0], 952732800)
+
+        df = pd.DataFrame({'A': pd.to_datetime(['2000-03-11 10:30:15'])})
+        jupyter_utils.everything.add_datepart(df, 'A', drop=False, time=True)
+        self.assertEqual(df.columns[0], 'A')
+        self.assertEqual((df['AHour'][0], df['AMinute'][0], df['ASecond'][0]), (10, 30, 15))
+
+    def test_get_sample_is_a_copy(self):
+        df = pd.DataFrame({'A': list(range(10))})
+        sample = jupyter_utils.everything.get_sample(df, 5)
+        sample['A'] = -1
+        self.assertEqual(df['A'].tolist(), list(range(10)))
@@ -0,0 +1,43 @@
+import unittest
+import pandas as pd
+import jupyter_utils.features, jupyter_utils.sketch
+import numpy as np
+
+
+class FeaturesTest(unittest.TestCase):
+
+    def test_column_stats_count_distinct_values_as_unique_does(self):
+        df = pd.DataFrame({'A': pd.Categorical(['x', 'y', None, 'x'], categories=[str(i) for i in range(40)] + ['x', 'y']),
+                           'B': ['a', 'b', 'c', None], 'C': [1., np.nan, np.nan, 1.]})
+        stats = jupyter_utils.features.column_stats(df, threads=2)
+        self.assertEqual(stats['distinct'].tolist(), [len(df[col].unique()) for col in df.columns])
+        self.assertEqual(stats['nulls'].tolist(), [1, 1, 2])
+        self.assertEqual(jupyter_utils.features.remove_variables_too_much_variance(df, num_states=4).columns.tolist(),
+                         ['A', 'C'])
+
+    def test_approximate_column_stats_are_within_the_sketch_error(self):
+        df = pd.DataFrame({'A': np.arange(50000).astype(str)})
+        stats = jupyter_utils.features.column_stats(df, approximate=True)
+        self.assertFalse(stats.at['A', 'exact'])
+        self.assertEqual(stats.at['A', 'error'], jupyter_utils.sketch.HyperLogLog().error)
+        self.assertLess(abs(stats.at['A', 'distinct'] - 50000), 3 * stats.at['A', 'error'] * 50000)
+        df['B'] = np.arange(50000).astype(str)
+        df.loc[:5000, 'B'] = 'x'
+        stats = jupyter_utils.features.column_stats(df, approximate=True)
+        self.assertEqual(jupyter_utils.features.remove_variable_variables(df, stats).columns.tolist(), ['B'])
+
+    def test_dateparts_match_series_dt(self):
+        random = np.random.RandomState(0)
+        timestamps = pd.to_datetime(random.randint(-2 * 10 ** 9, 2 * 10 ** 9, 500) * 10 ** 9)
+        for series in (pd.Series(timestamps, name='A'), pd.Series(timestamps.tz_localize('UTC').tz_convert('US/Eastern'))):
+            series = series.copy()
+            series[3] = pd.NaT
+            parts = jupyter_utils.features.dateparts(series, prefix='', time=True, chunk_size=64)
+            for part in parts.columns.drop(['Week', 'Elapsed']):
+                expected = getattr(series.dt, part.lower())
+                np.testing.assert_array_equal(parts[part].values, expected.values.astype(parts[part].dtype))
+            np.testing.assert_array_equal(parts['Week'].fillna(0).values,
+                                          series.dt.isocalendar().week.fillna(0).values.astype(np.float32))
+        self.assertEqual(parts['Elapsed'][0], timestamps[0].value // 10 ** 9)
+        self.assertEqual(parts['Year'].dtype, np.float32)
+        self.assertEqual(jupyter_utils.features.dateparts(pd.Series(timestamps), prefix='')['Month'].dtype, np.int8)
@@ -0,0 +1,152 @@
+import unittest, unittest.mock as mock, logging
+import pandas as pd
+import jupyter_utils.missing
+import numpy as np
+
+
+class _InlinePool:
+    """A stand-in for multiprocessing.Pool that runs its initializer and tasks in the calling process."""
+
+    def __init__(self, processes, initializer=None, initargs=()):
+        if initializer is not None:
+            initializer(*initargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def imap(self, func, iterable):
+        return map(func, iterable)
+
+
+class MissingTest(unittest.TestCase):
+
+    def _df(self):
+        random = np.random.RandomState(0)
+        df = pd.DataFrame({'A': random.rand(300), 'B': random.choice(['x', 'y', 'z'], 300), 'C': random.rand(300),
+                           'D': np.arange(300.)})
+        for col, ratio in (('A', 0.1), ('B', 0.3), ('C', 0.5)):
+            df.loc[random.rand(300) < ratio, col] = np.nan
+        return df
+
+    def test_profile_matches_isnull(self):
+        df = self._df()
+        profile = jupyter_utils.missing.profile(df, block_size=2, threads=2)
+        nulls = df.isnull()
+        self.assertEqual(profile.counts.to_dict(), nulls.sum().to_dict())
+        np.testing.assert_array_equal(profile.mask('B'), nulls['B'].values)
+        self.assertFalse(profile.mask('D').any())
+        expected = nulls[['A', 'B', 'C']].astype(int)
+        np.testing.assert_array_equal(profile.co_missing(chunk_size=64).values, expected.T.values @ expected.values)
+        self.assertEqual(jupyter_utils.missing.find(df, profile).to_dict(), jupyter_utils.missing.find(df).to_dict())
+
+    def test_indicators_hold_masks_as_indices_or_bitmaps(self):
+        import scipy.sparse
+        indicators = jupyter_utils.missing.MissingIndicators(100)
+        few, many = np.zeros(100, dtype=bool), np.arange(100) % 3 == 0
+        few[[5, 70]] = True
+        indicators.add('A_missing', few)
+        indicators.add('B_missing', many)
+        np.testing.assert_array_equal(indicators.indices('A_missing'), [5, 70])
+        np.testing.assert_array_equal(indicators['B_missing'], many)
+        np.testing.assert_array_equal(indicators.to_frame().values, np.column_stack([few, many]))
+        np.testing.assert_array_equal(indicators.to_sparse().toarray(), np.column_stack([few, many]))
+        stacked = indicators.hstack(np.ones((100, 2)), names=['B_missing'])
+        self.assertTrue(scipy.sparse.issparse(stacked))
+        np.testing.assert_array_equal(stacked.toarray(), np.column_stack([np.ones((100, 2)), many]))
+
+        df = self._df()
+        indicators = jupyter_utils.missing.MissingIndicators(len(df))
+        filled = jupyter_utils.missing.mark_continuous(df, indicators=indicators)
+        self.assertEqual(filled.columns.tolist(), df.columns.tolist())
+        self.assertEqual(indicators.names, ['A_missing', 'C_missing'])
+        np.testing.assert_array_equal(indicators['C_missing'], df['C'].isnull().values)
+
+    def test_fitted_impute_fills_batches_with_training_medians_and_modes(self):
+        import os, tempfile
+        df = self._df()
+        imputer = jupyter_utils.missing.FittedImpute(categorical='mode').fit(df)
+        self.assertEqual(imputer.fills['A'], df['A'].median())
+        self.assertEqual(imputer.fills['B'], df['B'].value_counts().idxmax())
+        with tempfile.TemporaryDirectory() as td:
+            imputer.save(os.path.join(td, 'fills.npz'))
+            imputer = jupyter_utils.missing.FittedImpute.load(os.path.join(td, 'fills.npz'))
+        self.assertEqual(imputer.fills['B'], df['B'].value_counts().idxmax())
+
+        batch = df.iloc[:50].copy()
+        missing = batch['C'].isnull()
+        self.assertIs(imputer.transform(batch, create_missing_cols=True), batch)
+        self.assertFalse(batch[['A', 'B', 'C']].isnull().any().any())
+        self.assertTrue((batch.loc[missing, 'C'] == df['C'].median()).all())
+        np.testing.assert_array_equal(batch['C_missing'], missing)
+
+        train = pd.DataFrame({'A': pd.array([1, 2, 3, 4], dtype='Int64'), 'B': pd.Categorical(['x', 'y', 'y', None])})
+        batch = pd.DataFrame({'A': pd.array([None, 5], dtype='Int64'), 'B': pd.Categorical([None, 'x'])})
+        jupyter_utils.missing.FittedImpute().fit(train).transform(batch)
+        self.assertEqual(batch['A'].tolist(), [2, 5])
+        self.assertEqual(batch['B'].tolist(), ['y', 'x'])
+
+        chunked = jupyter_utils.missing.FittedImpute().fit_chunks(df.iloc[i:i + 64] for i in range(0, len(df), 64))
+        values = df['A'].dropna().values
+        self.assertLessEqual(abs(np.mean(values <= chunked.fills['A']) - 0.5), 1.65 / 200 + 1. / len(values))
+
+    def test_online_impute_merges_chunk_estimates(self):
+        df = self._df()
+        first, second = jupyter_utils.missing.OnlineImpute(), jupyter_utils.missing.OnlineImpute()
+        first.update(df.iloc[:100])
+        second.update(df.iloc[100:200]).update(df.iloc[200:])
+        fills = first.merge(second).fills()
+        self.assertEqual(fills['B'], df['B'].value_counts().idxmax())
+        for col in ('A', 'C', 'D'):
+            values = df[col].dropna().values
+            self.assertLessEqual(abs(np.mean(values <= fills[col]) - 0.5), first.errors()[col] + 1. / len(values))
+
+        chunk = df.iloc[:30].copy()
+        first.transform(chunk)
+        self.assertFalse(chunk.isnull().any().any())
+        self.assertTrue((chunk.loc[df['A'].iloc[:30].isnull(), 'A'] == fills['A']).all())
+
+    def test_bayesian_impute_queries_and_fills_only_rows_with_nulls(self):
+        df = self._df()
+        df.index = df.index * 2 + 7
+        queried = []
+
+        def dataset(chunk):
+            queried.append(chunk)
+            context = mock.MagicMock()
+            context.__enter__.return_value = chunk
+            return context
+
+        def batch_query(network, chunk, logger):
+            # a prediction for every cell of the chunk, distinguishable from the original values
+            query = mock.Mock()
+            query.query.return_value = pd.DataFrame({'A': -1., 'B': 'q', 'C': -1., 'D': -1.}, index=chunk.index)
+            return query
+
+        with mock.patch.object(jupyter_utils.missing, 'bayesianpy') as bayesianpy, \
+                mock.patch.object(jupyter_utils.missing.BayesianImpute, '_train'):
+            bayesianpy.data.AutoType.return_value.get_discrete_variables.return_value = ['B']
+            bayesianpy.data.DefaultDataSet.side_effect = dataset
+            bayesianpy.output.BatchQuery.side_effect = batch_query
+            imputer = jupyter_utils.missing.BayesianImpute(df, logging.getLogger())
+            filled = imputer.fill_missing_cols(chunk_size=40, processes=1)
+            # the pool is run in this process, so the workers see the mocks whatever the platform's start method
+            with mock.patch('multiprocessing.get_context', return_value=mock.Mock(Pool=_InlinePool)) as get_context:
+                pooled = jupyter_utils.missing.BayesianImpute(df, logging.getLogger()).fill_missing_cols(chunk_size=40,
+                                                                                                          processes=2)
+            get_context.assert_called_once_with('spawn')
+            self.assertTrue(pooled.equals(filled))
+            bayesianpy.network.save.assert_called_once()
+            bayesianpy.network.load.assert_called_once_with(bayesianpy.network.save.call_args[0][1])
+
+        nulls = df.isnull()
+        self.assertTrue(all(len(chunk) <= 40 for chunk in queried))
+        half = len(queried) // 2
+        self.assertEqual(pd.concat(queried[:half]).index.tolist(), df.index[nulls.any(axis=1)].tolist())
+        self.assertEqual(pd.concat(queried[half:]).index.tolist(), df.index[nulls.any(axis=1)].tolist())
+        self.assertTrue(df.isnull().equals(nulls))
+        for col, prediction in (('A', -1.), ('B', 'q'), ('C', -1.), ('D', -1.)):
+            self.assertTrue((filled.loc[nulls[col], col] == prediction).all())
+            self.assertTrue(filled.loc[~nulls[col], col].equals(df.loc[~nulls[col], col]))
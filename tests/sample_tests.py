@@ -0,0 +1,39 @@
+import unittest
+import pandas as pd
+import jupyter_utils.sample
+import numpy as np
+
+
+class SampleTest(unittest.TestCase):
+
+    def test_random_split_partitions_rows_by_position(self):
+        df = pd.DataFrame({'A': np.arange(100)}, index=np.repeat(['x'], 100))
+        train, valid, test = jupyter_utils.sample.random_split(df, train_size=0.6, valid_size=0.3, random_state=1)
+        self.assertEqual((len(train), len(valid), len(test)), (60, 30, 10))
+        self.assertEqual(sorted(np.concatenate([train.A, valid.A, test.A])), list(range(100)))
+
+    def test_stratified_and_grouped_splits(self):
+        df = pd.DataFrame({'y': ['a'] * 80 + ['b'] * 20, 'g': np.arange(100) % 10})
+        train, valid, test = jupyter_utils.sample.random_split(df, stratify='y')
+        self.assertEqual(train.y.value_counts().to_dict(), {'a': 40, 'b': 10})
+        train, valid, test = jupyter_utils.sample.random_split(df, groups='g')
+        self.assertFalse(set(train.g) & (set(valid.g) | set(test.g)))
+
+    def test_reservoir_over_chunks_keeps_n_rows_in_order(self):
+        df = pd.DataFrame({'A': np.arange(1000), 'y': np.arange(1000) % 4})
+        chunks = (df.iloc[i:i + 64] for i in range(0, len(df), 64))
+        sample = jupyter_utils.sample.reservoir(chunks, 50, random_state=0)
+        self.assertEqual(len(sample), 50)
+        self.assertTrue(sample.index.is_monotonic_increasing)
+        self.assertEqual(len(set(jupyter_utils.sample.floyd(100, 100, random_state=0))), 100)
+        stratified = jupyter_utils.sample.get_sample(df, 5, stratify='y', random_state=0)
+        self.assertEqual(stratified.y.value_counts().tolist(), [5, 5, 5, 5])
+
+    def test_get_sample_follows_numpys_global_seed(self):
+        df = pd.DataFrame({'A': np.arange(1000)})
+        np.random.seed(5)
+        first = jupyter_utils.sample.get_sample(df, 10)
+        np.random.seed(5)
+        second = jupyter_utils.sample.get_sample(df, 10)
+        self.assertTrue(first.equals(second))
+        self.assertTrue(first.index.is_monotonic_increasing)
@@ -0,0 +1,82 @@
+import unittest, unittest.mock as mock
+import jupyter_utils.score
+import numpy as np
+
+
+class ScoreTest(unittest.TestCase):
+
+    def test_threshold_metrics_count_every_threshold(self):
+        y_true = np.array([0, 0, 1, 1, 1])
+        y_score = np.array([0.1, 0.6, 0.6, 0.8, 0.3])
+        metrics = jupyter_utils.score.threshold_metrics(y_true, y_score)
+        np.testing.assert_array_equal(metrics['threshold'], [0.8, 0.6, 0.3, 0.1])
+        np.testing.assert_array_equal(metrics['tp'], [1, 2, 3, 3])
+        np.testing.assert_array_equal(metrics['fp'], [0, 1, 1, 2])
+        np.testing.assert_allclose(metrics['accuracy'], [0.6, 0.6, 0.8, 0.6])
+        self.assertEqual(jupyter_utils.score.cutoff_youdens_j(metrics['false_positive_rate'],
+                                                              metrics['true_positive_rate'], metrics['threshold'])[0], 0.3)
+
+    def test_one_vs_rest_from_predicted_probabilities(self):
+        result = jupyter_utils.score.one_vs_rest(['a', 'b', 'c', 'c'], [[.8, .1, .1], [.1, .1, .8], [0, 0, 1], [0, 1, 0]],
+                                                 labels=['a', 'b', 'c'])
+        np.testing.assert_array_equal(result['tp'], [1, 0, 1])
+        np.testing.assert_array_equal(result['fp'], [0, 1, 1])
+        np.testing.assert_array_equal(result['fn'], [0, 1, 1])
+        # a class that never occurs, and one that isn't a label
+        result = jupyter_utils.score.one_vs_rest([0, 0, 1], [[.8, .1, .1], [.1, .1, .8], [0, 1, 0]])
+        np.testing.assert_array_equal(result['fp'], [0, 0, 1])
+        with self.assertRaises(ValueError):
+            jupyter_utils.score.one_vs_rest([0, 3], [0, 1], labels=[0, 1])
+
+    def test_accuracy_counts_each_class_against_the_rest(self):
+        model = mock.Mock(spec=['predict'])
+        model.predict.return_value = np.array(['a', 'b', 'c', 'b'])
+        result, x = jupyter_utils.score.accuracy(model, None, np.array(['a', 'b', 'c', 'c']),
+                                                 callback=jupyter_utils.score.precision)
+        np.testing.assert_array_equal(result['tp'], [1, 1, 1])
+        np.testing.assert_array_equal(result['fp'], [0, 1, 0])
+        np.testing.assert_array_equal(x, [1, 0.5, 1])
+        model.predict.return_value = np.array([0, 1, 1, 1])
+        self.assertEqual(jupyter_utils.score.accuracy(model, None, np.array([0, 0, 1, 1]))[0]['fp'], 1)
+
+    def test_accumulators_merge_across_chunks(self):
+        random = np.random.RandomState(0)
+        y_true = random.randint(0, 2, 1000)
+        y_score = np.clip(random.rand(1000) * 0.7 + y_true * 0.3, 0, 1)
+        first, second = jupyter_utils.score.RocHistogram(), jupyter_utils.score.RocHistogram()
+        first.update(y_true[:400], y_score[:400])
+        second.update(y_true[400:], y_score[400:])
+        roc = first.merge(second).result()
+        exact = jupyter_utils.score.sklearn.metrics.roc_auc_score(y_true, y_score)
+        self.assertLessEqual(abs(roc[2] - exact), first.auc_error)
+        counts = jupyter_utils.score.ConfusionCounts().update(y_true, y_score > 0.5)
+        self.assertEqual(counts.result()[0]['tp'], np.sum(y_true & (y_score > 0.5)))
+        with self.assertRaises(ValueError):
+            counts.update([0, 1, 2], [0, 1, 1])
+        with self.assertRaises(ValueError):
+            jupyter_utils.score.ConfusionCounts(labels=[0, 1, 2])
+        model = mock.Mock(spec=['predict', 'classes_'], classes_=np.array(['no', 'yes']))
+        model.predict.side_effect = lambda X: np.where(X > 0.5, 'yes', 'no')
+        labels = np.where(y_true > 0, 'yes', 'no')
+        result, _ = jupyter_utils.score.accuracy_chunks(model, ((y_score[i:i + 300], labels[i:i + 300])
+                                                                for i in range(0, 1000, 300)))
+        self.assertEqual(result['tp'], counts.result()[0]['tp'])
+
+    def test_roc_chunks_and_squared_errors(self):
+        random = np.random.RandomState(1)
+        y_true = random.randint(0, 2, 500)
+        y_score = np.clip(random.rand(500) * 0.6 + y_true * 0.4, 0, 1)
+        model = mock.Mock(spec=['predict_proba'])
+        model.predict_proba.side_effect = lambda X: np.column_stack([1 - X, X])
+        fpr, tpr, roc_auc, thresholds = jupyter_utils.score.roc_chunks(
+            model, ((y_score[i:i + 128], y_true[i:i + 128]) for i in range(0, 500, 128)), bins=200)
+        self.assertEqual((fpr[-1], tpr[-1]), (1., 1.))
+        histogram = jupyter_utils.score.RocHistogram(200).update(y_true, y_score)
+        self.assertLessEqual(abs(roc_auc - jupyter_utils.score.sklearn.metrics.roc_auc_score(y_true, y_score)),
+                             histogram.auc_error)
+
+        errors = jupyter_utils.score.SquaredErrors()
+        self.assertTrue(np.isnan(errors.result()))
+        errors.update(y_score[:200], y_true[:200]).merge(jupyter_utils.score.SquaredErrors().update(y_score[200:],
+                                                                                                    y_true[200:]))
+        self.assertAlmostEqual(errors.result(), jupyter_utils.score.rmse(y_score, y_true))
@@ -0,0 +1,45 @@
+import unittest
+import pandas as pd
+import jupyter_utils.sketch
+import numpy as np
+
+
+class SketchTest(unittest.TestCase):
+
+    def test_hyperloglog_counts_and_merges_within_its_error(self):
+        first = jupyter_utils.sketch.HyperLogLog().update(np.arange(60000))
+        second = jupyter_utils.sketch.HyperLogLog().update(np.arange(40000, 100000))
+        self.assertLess(abs(first.count() - 60000), 3 * first.error * 60000)
+        self.assertLess(abs(first.merge(second).count() - 100000), 3 * first.error * 100000)
+        self.assertEqual(jupyter_utils.sketch.HyperLogLog().update(['a', 'b', 'a', None]).count(), 3)
+
+    def test_quantile_sketch_median_is_within_its_rank_error(self):
+        random = np.random.RandomState(0)
+        values = random.lognormal(size=200000)
+        first = jupyter_utils.sketch.QuantileSketch(k=200, random_state=0)
+        second = jupyter_utils.sketch.QuantileSketch(k=200, random_state=1)
+        for chunk in np.array_split(values[:120000], 7):
+            first.update(chunk)
+        second.update(np.r_[values[120000:], np.nan])
+        self.assertEqual(len(second), 80000)
+        for sketch, seen in ((second, values[120000:]), (first.merge(second), values)):
+            rank = np.mean(seen <= sketch.median())
+            self.assertLess(abs(rank - 0.5), sketch.rank_error)
+            self.assertLess(abs(sketch.median() - np.median(seen)), 0.05)
+        self.assertEqual(len(first), 200000)
+        self.assertTrue(np.isnan(jupyter_utils.sketch.QuantileSketch().median()))
+
+    def test_frequent_items_keep_heavy_hitters_across_merges(self):
+        random = np.random.RandomState(0)
+        values = pd.Series(np.r_[np.repeat(['a', 'b'], [3000, 2000]), random.randint(0, 5000, 5000).astype(str)])
+        values = values.sample(frac=1, random_state=0).values
+        first = jupyter_utils.sketch.FrequentItems(capacity=50).update(values[:4000])
+        second = jupyter_utils.sketch.FrequentItems(capacity=50).update(np.r_[values[4000:], None])
+        merged = first.merge(second)
+        self.assertEqual(len(merged), 10000)
+        self.assertEqual(merged.most_frequent(), 'a')
+        self.assertLessEqual(len(merged.counts), 50)
+        exact = pd.Series(values).value_counts()
+        for value in ('a', 'b'):
+            self.assertLessEqual(exact[value] - merged.counts[value], merged.error)
+            self.assertLessEqual(merged.counts[value], exact[value])